@@ -0,0 +1,47 @@
+"""
+Measure how long a fresh interpreter takes to import the chipset modules
+behind each command-line tool.
+
+Each module is imported in a new `python -X importtime` process, several
+times, and the best cumulative import time of the chipset packages
+(including everything they pull in) is reported.
+"""
+import re
+import sys
+import argparse
+import subprocess
+
+
+MODULES = [
+    "chipset",
+    "chipset.memory.memory",
+    "chipset.pcr.port_mapper",
+    "chipset.pci.tool",
+    "chipset.pci.sysfs",
+    "chipset.pci.decode",
+]
+
+def import_time_us(module):
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                         stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total = 0
+    for line in res.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", line)
+        if m is not None and m.group(2).startswith("chipset"):
+            total += int(m.group(1))
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=5,
+                        help="Number of runs per module")
+    parser.add_argument("module", nargs="*", default=MODULES,
+                        help="Modules to measure")
+    args = parser.parse_args()
+    for module in args.module:
+        best = min(import_time_us(module) for _ in range(args.repeat))
+        print("%-28s %8.2f ms" % (module, best / 1000))
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
-from .pcr import PCR
-from .memory import Memory
-from .pci import PCI
+from ._lazy import lazy_module
+
+
+# Attributes are imported on first access (PEP 562) so that, e.g., memtool
+# does not pay for loading the libpci extension.
+__getattr__, __dir__ = lazy_module(__name__, {
+    "PCR": ".pcr",
+    "Memory": ".memory",
+    "PCI": ".pci",
+})
@@ -0,0 +1,25 @@
+"""
+Lazily imported package attributes (PEP 562).
+"""
+import sys
+import importlib
+
+
+def lazy_module(name, mapping):
+    """
+    Return `(__getattr__, __dir__)` for package `name`, importing each
+    attribute in `mapping` (`{attribute: relative module}`) on first access
+    and caching it in the package.
+    """
+    def __getattr__(attr):
+        if attr not in mapping:
+            raise AttributeError("module %r has no attribute %r" % (name, attr))
+        module = sys.modules[name]
+        value = getattr(importlib.import_module(mapping[attr], name), attr)
+        setattr(module, attr, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[name])) | set(mapping))
+
+    return __getattr__, __dir__
@@ -0,0 +1 @@
+from .exporter import Exporter, Metric, parse_metric, load_config, make_server
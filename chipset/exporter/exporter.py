@@ -0,0 +1,274 @@
+"""
+A long-running exporter of register and configuration space values in the
+Prometheus text format.
+
+The exporter keeps its `Memory`, `PCR` and PCI handles open.  On a scrape,
+only metrics whose TTL has expired are read again; they are grouped per
+target (physical memory, PCR port or PCI function) and every run of
+adjacent registers is fetched with one block read.  Scrapes are
+serialised, so concurrent scrapers share one round of hardware reads.
+"""
+import os
+import re
+import json
+import time
+import threading
+import socketserver
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+SOURCES = ("mem", "pcr", "pci")
+SIZES = (1, 2, 4, 8)
+PCI_BACKENDS = ("libpci", "sysfs")
+OPTIONS = ("pcr_base", "pci_backend")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_PORT = 9750
+
+_DEVICE = re.compile(r"(?:([0-9a-fA-F]+):)?([0-9a-fA-F]{1,2}):([0-9a-fA-F]{1,2})\.([0-7])")
+
+# `target` is None for "mem", the port for "pcr" and (domain, bus, dev,
+# func) for "pci"; `offset` is the physical address for "mem".
+Metric = namedtuple("Metric", ("name", "source", "target", "offset", "size", "shift",
+                               "mask", "ttl", "help", "labels"))
+
+def _int(value):
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+def _parse_device(value):
+    match = _DEVICE.fullmatch(value)
+    if match is None:
+        raise ValueError("can't parse %r as a [dddd:]bb:dd.f PCI address" % (value,))
+    return tuple(int(group or "0", 16) for group in match.groups())
+
+def parse_metric(entry):
+    """
+    Build a `Metric` from a configuration dictionary.  Numbers may be given
+    as strings in any base Python accepts ("0x10").
+    """
+    source = entry.get("source")
+    if source not in SOURCES:
+        raise ValueError("metric %r: source must be one of %r" % (entry.get("name"), SOURCES))
+    size = _int(entry.get("size", 4))
+    if size not in SIZES:
+        raise ValueError("metric %r: size must be one of %r" % (entry.get("name"), SIZES))
+    if source == "mem":
+        target, offset = None, _int(entry["address"])
+    elif source == "pcr":
+        target, offset = _int(entry["port"]), _int(entry["offset"])
+    else:
+        target, offset = _parse_device(entry["device"]), _int(entry["offset"])
+    if offset % size:
+        raise ValueError("metric %r: offset is not %d-byte aligned" % (entry["name"], size))
+    return Metric(entry["name"], source, target, offset, size, _int(entry.get("shift", 0)),
+                  _int(entry.get("mask", (1 << (size * 8)) - 1)), float(entry.get("ttl", 1.0)),
+                  entry.get("help", ""), tuple(sorted(entry.get("labels", {}).items())))
+
+def load_config(path):
+    """
+    Load `{"metrics": [...], "pcr_base": ..., "pci_backend": ...}` from a
+    JSON file.  Returns `(metrics, options)`.
+    """
+    with open(path) as f:
+        doc = json.load(f)
+    metrics = [parse_metric(entry) for entry in doc.get("metrics", ())]
+    options = {key: value for key, value in doc.items() if key != "metrics"}
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise ValueError("unknown options %s" % (", ".join(sorted(unknown)),))
+    return metrics, options
+
+def covering_blocks(metrics):
+    """
+    Group metrics into `(start, length, [metrics])` reads of whole 32-bit
+    registers.  Only overlapping or adjacent registers are merged, so no
+    register is read that no metric asked for.
+    """
+    blocks = []
+    for metric in sorted(metrics, key=lambda m: m.offset):
+        start = metric.offset & ~3
+        end = (metric.offset + metric.size + 3) & ~3
+        if blocks and start <= blocks[-1][0] + blocks[-1][1]:
+            first, length, members = blocks[-1]
+            blocks[-1] = (first, max(length, end - first), members + [metric])
+        else:
+            blocks.append((start, end - start, [metric]))
+    return blocks
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class Exporter:
+    def __init__(self, metrics, pcr_base=None, pci_backend="libpci"):
+        if pci_backend not in PCI_BACKENDS:
+            raise ValueError("pci_backend must be one of %r" % (PCI_BACKENDS,))
+        self.metrics = list(metrics)
+        self.pcr_base = pcr_base
+        self.pci_backend = pci_backend
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.errors = 0
+        self._values = {}
+        self._expires = {}
+        self._memory = None
+        self._pcr = None
+        self._pci = None
+        self._devices = {}
+
+    def close(self):
+        for handle in (self._memory, self._pcr, self._pci):
+            if handle is not None:
+                handle.close()
+        self._memory = self._pcr = self._pci = None
+        self._devices.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_t, ex_v, ex_tb):
+        self.close()
+        return False
+
+    def _read_mem(self, target, start, length):
+        if self._memory is None:
+            from ..memory import Memory
+            self._memory = Memory()
+        return self._memory.read_dwords(start, length // 4).tobytes()
+
+    def _read_pcr(self, port, start, length):
+        if self._pcr is None:
+            from ..pcr import PCR
+            base = PCR.find_pcr_base() if self.pcr_base is None else _int(self.pcr_base)
+            self._pcr = PCR(base)
+        return self._pcr.read_registers(port, start, length // 4).tobytes()
+
+    def _read_pci(self, key, start, length):
+        dev = self._devices.get(key)
+        if dev is None:
+            if self._pci is None:
+                if self.pci_backend == "sysfs":
+                    from ..pci.sysfs import SysfsPCI
+                    self._pci = SysfsPCI(scan=False)
+                else:
+                    from ..pci.pci import PCI
+                    self._pci = PCI(scan=False)
+            dev = self._devices[key] = self._pci.get_device(*key)
+        return None if dev is None else dev.read_block(start, length)
+
+    def refresh(self, now=None):
+        """
+        Reread every metric whose TTL has expired.  Must be called with
+        `lock` held.
+        """
+        if now is None:
+            now = time.monotonic()
+        due = {}
+        for metric in self.metrics:
+            if self._expires.get(metric, 0) <= now:
+                due.setdefault((metric.source, metric.target), []).append(metric)
+        for (source, target), metrics in due.items():
+            read = getattr(self, "_read_" + source)
+            for start, length, members in covering_blocks(metrics):
+                self.reads += 1
+                try:
+                    data = read(target, start, length)
+                except (OSError, ValueError):
+                    data = None
+                if data is None or len(data) < length:
+                    data = None
+                    self.errors += 1
+                for metric in members:
+                    if data is None:
+                        self._values.pop(metric, None)
+                    else:
+                        pos = metric.offset - start
+                        raw = int.from_bytes(data[pos:pos + metric.size], "little")
+                        self._values[metric] = (raw >> metric.shift) & metric.mask
+                    self._expires[metric] = now + metric.ttl
+
+    def render(self):
+        """
+        Refresh expired metrics and return the text exposition.
+        """
+        with self.lock:
+            self.refresh()
+            values = dict(self._values)
+            reads, errors = self.reads, self.errors
+        lines = []
+        described = set()
+        for metric in self.metrics:
+            if metric not in values:
+                continue
+            if metric.name not in described:
+                described.add(metric.name)
+                if metric.help:
+                    lines.append("# HELP %s %s" % (metric.name, metric.help.replace("\n", " ")))
+                lines.append("# TYPE %s gauge" % (metric.name,))
+            labels = ",".join("%s=\"%s\"" % (key, _escape(value)) for key, value in metric.labels)
+            lines.append("%s%s %d" % (metric.name, "{%s}" % (labels,) if labels else "",
+                                      values[metric]))
+        lines.append("# TYPE chipset_exporter_reads_total counter")
+        lines.append("chipset_exporter_reads_total %d" % (reads,))
+        lines.append("# TYPE chipset_exporter_read_errors_total counter")
+        lines.append("chipset_exporter_read_errors_total %d" % (errors,))
+        return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.exporter.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(exporter, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None):
+    """
+    Return an HTTP server for `exporter` on `host:port`, or on the Unix
+    socket `unix_path` if given.  Call `serve_forever()` on it.
+    """
+    if unix_path is not None:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+        server = UnixHTTPServer(unix_path, MetricsHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+    server.exporter = exporter
+    return server
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Export register and PCI configuration values for Prometheus")
+    parser.add_argument("config", help="JSON file describing the metrics")
+    listen = parser.add_mutually_exclusive_group()
+    listen.add_argument("--listen", default="127.0.0.1:%d" % (DEFAULT_PORT,),
+                        help="host:port to listen on (default: %(default)s)")
+    listen.add_argument("--unix", metavar="PATH",
+                        help="Listen on a Unix socket instead")
+    args = parser.parse_args()
+
+    metrics, options = load_config(args.config)
+    host, _, port = args.listen.rpartition(":")
+    with Exporter(metrics, **options) as exporter:
+        server = make_server(exporter, host or "127.0.0.1", int(port), args.unix)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import os
+import mmap
+import array
 import struct
-import argparse
+import contextlib
+from ..wait import wait_for, DEFAULT_POLICY
 
 
 class Memory:
@@ -61,8 +64,61 @@ class Memory:
     def write_byte(self, address, value):
         return self.write_unsigned(address, value, 1)
 
+    @contextlib.contextmanager
+    def _mapped(self, address, length):
+        if address % 4:
+            raise ValueError("address %x is not dword-aligned" % (address,))
+        # The native helpers live in the cffi extension built for chipset.pci;
+        # it is only loaded here so that plain /dev/mem access stays cheap.
+        from ..pci._libpci import lib, ffi
+        start = address - address % mmap.ALLOCATIONGRANULARITY
+        region = mmap.mmap(self.fd, address + length - start, offset=start)
+        try:
+            with ffi.from_buffer(region, require_writable=True) as base:
+                yield lib, ffi, base + (address - start)
+        finally:
+            region.close()
+
+    def read_dwords(self, address, count):
+        """
+        Read `count` dwords with guaranteed 32-bit accesses in one native
+        call.  Returns an `array.array("I")`.
+        """
+        out = array.array("I", bytes(count * 4))
+        with self._mapped(address, count * 4) as (lib, ffi, base):
+            lib.chipset_mmio_read32(base, ffi.from_buffer("uint32_t[]", out), count)
+        return out
+
+    def write_dwords(self, address, values):
+        values = array.array("I", values)
+        with self._mapped(address, len(values) * 4) as (lib, ffi, base):
+            lib.chipset_mmio_write32(base, ffi.from_buffer("uint32_t[]", values), len(values))
+
+    def rmw_dwords(self, address, masks, values):
+        """
+        For each dword, keep the bits set in the matching entry of `masks`
+        and take the rest from `values`.
+        """
+        masks = array.array("I", masks)
+        values = array.array("I", values)
+        if len(masks) != len(values):
+            raise ValueError("masks and values must have the same length")
+        with self._mapped(address, len(values) * 4) as (lib, ffi, base):
+            lib.chipset_mmio_rmw32(base, ffi.from_buffer("uint32_t[]", masks),
+                                   ffi.from_buffer("uint32_t[]", values), len(values))
+
+    def wait_for(self, address, size, mask, value, timeout, policy=DEFAULT_POLICY):
+        """
+        Wait until the `size`-byte value at `address`, masked with `mask`,
+        equals `value`; see `chipset.wait.wait_for`.
+        """
+        return wait_for(lambda: self.read_unsigned(address, size),
+                        mask, value, timeout, policy=policy)
+
 
 def main():
+    import argparse
+
     def read(args):
         fmt = "%08x : %0" + str(args.size * 2) + "x"
         with Memory() as mem:
@@ -1 +1,11 @@
-from .pci import PCI, constants
+from .._lazy import lazy_module
+
+
+# Loaded on first access (PEP 562): the libpci extension is only needed by
+# PCI itself.  Every other module here -- the sysfs, ECAM and archive
+# backends, the decoders, the capability walker and the ID database -- works
+# without it, taking its constants from `regs`.
+__getattr__, __dir__ = lazy_module(__name__, {
+    "PCI": ".pci",
+    "constants": ".pci",
+})
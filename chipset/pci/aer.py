@@ -0,0 +1,129 @@
+"""
+Batched PCIe Advanced Error Reporting (AER) collection.
+
+`AERCollector` finds each device's AER extended capability once and then
+reads all of its status, mask, severity and log registers with a single
+block read per function and sample (skipping the root error registers on
+functions other than root ports and event collectors).  Each sample is compared with the
+previous one for the same function, so the records say which error bits
+appeared since the last sweep.  Clearing the (write-1-to-clear) status
+registers after reading is opt-in.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from .decode import ERR_LAYOUT, AERCapability
+from .topology import Topology
+from .regs import (PCI_CAP_EXTENDED, PCI_ERR_COR_STATUS, PCI_ERR_ROOT_COMMAND,
+                   PCI_ERR_UNCOR_STATUS, PCI_EXP_TYPE_RC_EC, PCI_EXP_TYPE_ROOT_PORT,
+                   PCI_EXT_CAP_ID_ERR)
+
+
+AER_SIZE = ERR_LAYOUT.size
+# Port types that implement the root error registers.
+ROOT_PORT_TYPES = (PCI_EXP_TYPE_ROOT_PORT, PCI_EXP_TYPE_RC_EC)
+
+# `registers` is the decoded `AERCapability` (its root_* and err_source
+# fields only mean something on root ports); `uncor_new` and `cor_new` are
+# the status bits set now but not in the previous sample of this function.
+AERRecord = namedtuple("AERRecord", (
+    "address", "time_ns", "registers", "uncor_new", "cor_new", "cleared"))
+
+class AERCollector:
+    def __init__(self, access, clear=False, workers=8):
+        """
+        With `clear`, status bits found set are written back to clear them,
+        so each sample only shows errors since the previous one.  Reads fan
+        out over `workers` threads if `access.parallel` is set.
+        """
+        self.access = access
+        self.clear = clear
+        self.workers = workers
+        self._offsets = None
+        self._generation = None
+        self._buffers = {}
+        self._previous = {}
+        # `{address: (uncorrectable, correctable)}` counts of new error bits.
+        self.totals = {}
+
+    def refresh(self):
+        """
+        Forget the cached capability offsets.  This happens by itself when
+        `access` rescans.
+        """
+        self._offsets = None
+        self._buffers.clear()
+        self._previous.clear()
+
+    @property
+    def offsets(self):
+        """
+        `{(domain, bus, dev, func): (device, AER offset)}` for every device
+        with an AER capability, located on first use and again after each
+        rescan of `access`.
+        """
+        if self._offsets is not None and self._generation != self.access.generation:
+            self.refresh()
+        if self._offsets is None:
+            offsets = {}
+            for dev in self.access:
+                pos = dev.find_capability_offset(PCI_EXT_CAP_ID_ERR, PCI_CAP_EXTENDED)
+                if pos is not None:
+                    key = (dev.domain, dev.bus, dev.dev, dev.func)
+                    offsets[key] = (dev, pos)
+                    buf = bytearray(AER_SIZE)
+                    length = AER_SIZE if Topology.port_type(dev) in ROOT_PORT_TYPES \
+                        else PCI_ERR_ROOT_COMMAND
+                    self._buffers[key] = (buf, memoryview(buf)[:length])
+            self._offsets = offsets
+            self._generation = self.access.generation
+        return self._offsets
+
+    def _sample(self, key, dev, pos):
+        buf, view = self._buffers[key]
+        if dev.config is not None:
+            # Status registers are volatile: refresh the buffered copy.
+            dev.invalidate(pos, len(view))
+        if dev.read_block_into(pos, view) is None:
+            return None
+        now = time.monotonic_ns()
+        regs = AERCapability(*ERR_LAYOUT.unpack_from(buf))
+        prev = self._previous.get(key)
+        prev_uncor, prev_cor = (0, 0) if prev is None else prev
+        cleared = False
+        if self.clear and (regs.uncor_status or regs.cor_status):
+            # Write-1-to-clear bits must not wait for a flush.
+            cleared = True
+            if regs.uncor_status:
+                cleared &= dev.write_long_unbuffered(pos + PCI_ERR_UNCOR_STATUS,
+                                                     regs.uncor_status)
+            if regs.cor_status:
+                cleared &= dev.write_long_unbuffered(pos + PCI_ERR_COR_STATUS, regs.cor_status)
+        self._previous[key] = (0, 0) if cleared else (regs.uncor_status, regs.cor_status)
+        uncor_new = regs.uncor_status & ~prev_uncor
+        cor_new = regs.cor_status & ~prev_cor
+        if uncor_new or cor_new:
+            uncor_total, cor_total = self.totals.get(key, (0, 0))
+            self.totals[key] = (uncor_total + bin(uncor_new).count("1"),
+                                cor_total + bin(cor_new).count("1"))
+        return AERRecord(key, now, regs, uncor_new, cor_new, cleared)
+
+    def collect(self):
+        """
+        Sample every AER capability once and return the `AERRecord`s, in
+        device order.  Functions that can't be read are left out.
+        """
+        items = list(self.offsets.items())
+        sample = lambda item: self._sample(item[0], *item[1])
+        if getattr(self.access, "parallel", False) and self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                records = list(pool.map(sample, items))
+        else:
+            records = [sample(item) for item in items]
+        return [rec for rec in records if rec is not None]
+
+    def errors(self):
+        """
+        Collect and return only the records with new error bits.
+        """
+        return [rec for rec in self.collect() if rec.uncor_new or rec.cor_new]
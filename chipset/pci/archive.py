@@ -0,0 +1,166 @@
+"""
+Full-topology configuration space dumps.
+
+`dump_devices` snapshots every function of an access backend, in parallel
+when the backend allows it, and `write_archive`/`load_archive` store and
+restore those snapshots as a compact binary file or as JSON lines.  Loaded
+archives behave like a read-only backend.
+"""
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from .base import BaseAccess, BaseDevice
+from .regs import PCI_VENDOR_ID, PCI_DEVICE_ID, PCI_CLASS_DEVICE
+
+
+ARCHIVE_MAGIC = b"PCIDUMP1"
+FORMATS = ("binary", "jsonl")
+
+DumpRecord = namedtuple("DumpRecord", ("domain", "bus", "dev", "func", "config"))
+
+_RECORD_HEADER = struct.Struct("<IBBBxH")
+
+def _snapshot(dev, size):
+    buf = bytearray(size)
+    if dev.read_block_into(0, buf) is None:
+        if size <= 256:
+            return None
+        buf = bytearray(256)
+        if dev.read_block_into(0, buf) is None:
+            return None
+    return DumpRecord(dev.domain, dev.bus, dev.dev, dev.func, bytes(buf))
+
+def dump_devices(access, size=4096, workers=8):
+    """
+    Return a `DumpRecord` for every device `access` knows about.  Devices
+    whose extended space can't be read are dumped with 256 bytes.  Reads
+    fan out over a thread pool only if `access.parallel` is set.
+    """
+    devices = list(access)
+    if getattr(access, "parallel", False) and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            records = list(pool.map(lambda dev: _snapshot(dev, size), devices))
+    else:
+        records = [_snapshot(dev, size) for dev in devices]
+    return [rec for rec in records if rec is not None]
+
+def write_archive(f, records, fmt="binary"):
+    """
+    Write records to a binary file object (`fmt="binary"`) or a text file
+    object (`fmt="jsonl"`).
+    """
+    if fmt == "binary":
+        f.write(ARCHIVE_MAGIC)
+        for rec in records:
+            f.write(_RECORD_HEADER.pack(rec.domain, rec.bus, rec.dev, rec.func,
+                                        len(rec.config)))
+            f.write(rec.config)
+    elif fmt == "jsonl":
+        for rec in records:
+            f.write(json.dumps({"domain": rec.domain, "bus": rec.bus, "dev": rec.dev,
+                                "func": rec.func, "config": rec.config.hex()}) + "\n")
+    else:
+        raise ValueError("format must be one of %r" % (FORMATS,))
+
+def read_archive(data):
+    """
+    Parse the bytes of an archive in either format into `DumpRecord`s.
+    """
+    if data.startswith(ARCHIVE_MAGIC):
+        records = []
+        pos = len(ARCHIVE_MAGIC)
+        while pos < len(data):
+            domain, bus, dev, func, length = _RECORD_HEADER.unpack_from(data, pos)
+            pos += _RECORD_HEADER.size
+            records.append(DumpRecord(domain, bus, dev, func, data[pos:pos + length]))
+            pos += length
+        return records
+    records = []
+    for line in data.decode().splitlines():
+        if line.strip():
+            rec = json.loads(line)
+            records.append(DumpRecord(rec["domain"], rec["bus"], rec["dev"], rec["func"],
+                                      bytes.fromhex(rec["config"])))
+    return records
+
+def load_archive(path):
+    with open(path, "rb") as f:
+        return ArchiveAccess(read_archive(f.read()))
+
+class ArchiveAccess(BaseAccess):
+    """
+    A read-only backend over archived configuration spaces.
+    """
+    parallel = True
+
+    def __init__(self, records):
+        self.records = records
+        self.rescan_bus()
+
+    def close(self):
+        pass
+
+    def rescan_bus(self, buses=None, domain=None):
+        domain, buses = self._rescan_target(buses, domain)
+        if buses is None:
+            self._build_index(self._index_entries())
+            return
+        self._merge_index(domain, buses, self._index_entries(
+            lambda rec: rec.domain == domain and rec.bus in buses))
+
+    def _index_entries(self, select=None):
+        for rec in self.records:
+            if select is not None and not select(rec):
+                continue
+            dev = DumpedDevice(rec, self)
+            yield ((rec.domain, rec.bus, rec.dev, rec.func), dev.vendor_id,
+                   dev.device_id, dev.device_class, dev)
+
+    def get_device(self, domain, bus, device, function):
+        return self._by_address.get((domain, bus, device, function))
+
+class DumpedDevice(BaseDevice):
+    def __init__(self, record, access=None):
+        super().__init__(access)
+        self.domain = record.domain
+        self.bus = record.bus
+        self.dev = record.dev
+        self.func = record.func
+        self.config = bytearray(record.config)
+
+    @property
+    def vendor_id(self):
+        return self.read_word(PCI_VENDOR_ID)
+
+    @property
+    def device_id(self):
+        return self.read_word(PCI_DEVICE_ID)
+
+    @property
+    def device_class(self):
+        return self.read_word(PCI_CLASS_DEVICE)
+
+    def invalidate(self, pos=None, length=None):
+        self._cap_index = None
+
+    # Anything outside the archived bytes reads as all-ones, like a missing
+    # device, and every write is refused.
+
+    def _hw_read_byte(self, pos):
+        return 0xff
+
+    def _hw_read_word(self, pos):
+        return 0xffff
+
+    def _hw_read_long(self, pos):
+        return 0xffffffff
+
+    def _hw_read_into(self, pos, view):
+        return False
+
+    def _read_only(self, *args):
+        raise ValueError("archived devices are read-only")
+
+    write_byte = write_word = write_long = write_block = _read_only
+    _hw_write_byte = _hw_write_word = _hw_write_long = _hw_write_block = _read_only
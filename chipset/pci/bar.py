@@ -0,0 +1,93 @@
+"""
+Memory-mapped access to device BARs.
+
+A `BarMapping` maps a BAR once (through sysfs `resourceN` or /dev/mem) and
+reads and writes registers through typed memoryviews, so each access is a
+single load or store of the requested width.  The mapping is released by
+`close`, by leaving a `with` block, or when the object is collected.
+"""
+import os
+import mmap
+import weakref
+
+
+def _unmap(views, region, fd):
+    for view in views:
+        view.release()
+    region.close()
+    os.close(fd)
+
+class BarMapping:
+    def __init__(self, path, offset, size, writeable=True):
+        flags = (os.O_RDWR | os.O_SYNC) if writeable else os.O_RDONLY
+        fd = os.open(path, flags)
+        try:
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            delta = offset - start
+            access = mmap.ACCESS_WRITE if writeable else mmap.ACCESS_READ
+            region = mmap.mmap(fd, delta + size, offset=start, access=access)
+        except Exception:
+            os.close(fd)
+            raise
+        self.path = path
+        self.offset = offset
+        self.size = size
+        raw = memoryview(region)
+        self._u8 = raw[delta:delta + size]
+        self._u32 = self._u8[:size - size % 4].cast("I")
+        self._u64 = self._u8[:size - size % 8].cast("Q")
+        views = [self._u64, self._u32, self._u8, raw]
+        self._finalizer = weakref.finalize(self, _unmap, views, region, fd)
+
+    def close(self):
+        self._finalizer()
+
+    @property
+    def closed(self):
+        return not self._finalizer.alive
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_t, ex_v, ex_tb):
+        self.close()
+        return False
+
+    @staticmethod
+    def _index(offset, width):
+        if offset % width:
+            raise ValueError("offset %x is not %d-byte aligned" % (offset, width))
+        return offset // width
+
+    def read8(self, offset):
+        return self._u8[offset]
+
+    def write8(self, offset, value):
+        self._u8[offset] = value
+
+    def read32(self, offset):
+        return self._u32[self._index(offset, 4)]
+
+    def write32(self, offset, value):
+        self._u32[self._index(offset, 4)] = value
+
+    def read64(self, offset):
+        return self._u64[self._index(offset, 8)]
+
+    def write64(self, offset, value):
+        self._u64[self._index(offset, 8)] = value
+
+    def array32(self, offset, count):
+        """
+        Return a live memoryview of `count` 32-bit registers at `offset`.
+        It must be released before the mapping is closed.
+        """
+        idx = self._index(offset, 4)
+        return self._u32[idx:idx + count]
+
+    def read_array32(self, offset, count):
+        """
+        Copy `count` 32-bit registers at `offset` into a list.
+        """
+        idx = self._index(offset, 4)
+        return self._u32[idx:idx + count].tolist()
@@ -0,0 +1,496 @@
+"""
+Backend-independent parts of the PCI interface.
+
+`BaseAccess` keeps the device indices that every access backend exposes,
+and `BaseDevice` implements configuration space buffering and capability
+indexing on top of a handful of `_hw_*` accessors supplied by each backend.
+"""
+import os
+import struct
+import itertools
+from collections import namedtuple
+from .capabilities import CapabilityIndex, IndexedCapability
+from .topology import Topology
+from .regs import (PCI_BASE_ADDRESS_MEM_MASK, PCI_BASE_ADDRESS_SPACE_IO, PCI_CLASS_DEVICE,
+                   PCI_HEADER_TYPE, PCI_HEADER_TYPE_MULTIFUNCTION, PCI_VENDOR_ID)
+
+
+CONFIG_SIZES = (256, 4096)
+SYSFS_ROOT = "/sys/bus/pci/devices"
+
+SegmentStats = namedtuple("SegmentStats", ("devices", "buses", "first_bus", "last_bus"))
+
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+class DeviceInfo:
+    """
+    An immutable copy of everything a backend knows about a device, as
+    `pci_fill_info` would fill it.  Fields the backend could not fill are
+    None.
+    """
+    __slots__ = ("domain", "bus", "dev", "func", "vendor_id", "device_id",
+                 "device_class", "irq", "base_addr", "sizes", "rom_base_addr",
+                 "rom_size", "phy_slot", "module_alias", "label", "numa_node",
+                 "flags", "rom_flags")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DeviceInfo is read-only")
+
+    def __repr__(self):
+        return "DeviceInfo(%s)" % (", ".join("%s=%r" % (name, getattr(self, name))
+                                             for name in self.__slots__),)
+
+class BaseAccess:
+    """
+    Subclasses implement `rescan_bus(buses=None, domain=None)`, rescanning
+    everything, one domain (PCI segment), or selected buses of a domain
+    (domain 0 if not given), and call `_build_index` (full scans) or
+    `_merge_index` (partial ones) from it.
+    The indices are built by the first query if nothing has been scanned.
+    Iterating over the access object is the portable way to walk the
+    devices; `first_device`/`devices` and each device's `next` mirror
+    libpci's linked list.
+    """
+    # Whether devices may be accessed from several threads at once.
+    parallel = False
+    _entries = None
+    # Bumped whenever the indices are rebuilt, so that callers caching
+    # devices can tell that they may have been replaced.
+    generation = 0
+
+    @property
+    def threadsafe(self):
+        """
+        Whether the backend and its devices may be shared between threads.
+        Backends that allow parallel access are; libpci is only when asked.
+        """
+        return self.parallel
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_t, ex_v, ex_tb):
+        self.close()
+        return False
+
+    def _build_index(self, entries):
+        """
+        `entries` yields `((domain, bus, dev, func), vendor_id, device_id,
+        device_class, device)` in enumeration order.
+        """
+        self._entries = entries = list(entries)
+        self._devices = []
+        self._by_address = {}
+        self._by_id = {}
+        self._by_class = {}
+        self._by_domain = {}
+        self._idents = {}
+        self._following = {}
+        for key, vendor_id, device_id, device_class, dev in entries:
+            self._devices.append(dev)
+            self._by_domain.setdefault(key[0], []).append(dev)
+            self._by_address[key] = dev
+            self._idents[key] = (vendor_id, device_id)
+            self._by_id.setdefault((vendor_id, device_id), []).append(dev)
+            self._by_class.setdefault(device_class, []).append(dev)
+        self._domains = sorted(self._by_domain)
+        for (key, *_), (_, *_, dev) in zip(entries, entries[1:]):
+            self._following[key] = dev
+        self._topology = None
+        self.generation += 1
+
+    def _merge_index(self, domain, buses, entries):
+        """
+        Replace the index entries on `buses` of `domain` with `entries`,
+        keeping everything else, and rebuild the indices in address order.
+        """
+        kept = [entry for entry in self._entries or ()
+                if entry[0][0] != domain or entry[0][1] not in buses]
+        self._build_index(sorted(kept + list(entries), key=lambda entry: entry[0]))
+
+    @staticmethod
+    def _rescan_target(buses, domain):
+        """
+        Normalise `rescan_bus` arguments to `(domain, set of buses)`, or
+        `(None, None)` for a full rescan.  A domain without buses means all
+        256 buses of that domain.
+        """
+        if buses is None:
+            return (None, None) if domain is None else (domain, set(range(256)))
+        return (0 if domain is None else domain, set(buses))
+
+    def _ensure_index(self):
+        if self._entries is None:
+            self.rescan_bus()
+
+    def _probe_buses(self, domain, buses):
+        """
+        Yield index entries for every function that answers on `buses`,
+        probing through `get_device`.  Functions 1-7 are only probed on
+        multi-function devices.  Absent functions are passed to `_release`.
+        """
+        for bus in buses:
+            for slot in range(32):
+                for func in range(8):
+                    dev = self.get_device(domain, bus, slot, func)
+                    ident = dev.read_long(PCI_VENDOR_ID)
+                    if ident & 0xffff in (0xffff, 0):
+                        self._release(dev)
+                        if func == 0:
+                            break
+                        continue
+                    yield ((domain, bus, slot, func), ident & 0xffff, ident >> 16,
+                           dev.read_word(PCI_CLASS_DEVICE), dev)
+                    if func == 0 and not (dev.read_byte(PCI_HEADER_TYPE) &
+                                          PCI_HEADER_TYPE_MULTIFUNCTION):
+                        break
+
+    def _release(self, dev):
+        pass
+
+    @property
+    def topology(self):
+        """
+        The bridge `Topology`, built on first use after each rescan.
+        """
+        self._ensure_index()
+        if self._topology is None:
+            self._topology = Topology(self._by_address.items())
+        return self._topology
+
+    @property
+    def first_device(self):
+        """
+        The first device in enumeration order, or None.
+        """
+        self._ensure_index()
+        return self._devices[0] if self._devices else None
+
+    @property
+    def devices(self):
+        return self.first_device
+
+    def snapshot_all(self):
+        """
+        Return a `DeviceInfo` for every device.
+        """
+        return [dev.snapshot() for dev in self]
+
+    def _next_device(self, dev):
+        self._ensure_index()
+        return self._following.get((dev.domain, dev.bus, dev.dev, dev.func))
+
+    def __iter__(self):
+        self._ensure_index()
+        return iter(self._devices)
+
+    def __len__(self):
+        self._ensure_index()
+        return len(self._devices)
+
+    def search_for_device(self, bus, device, function, domain=None):
+        """
+        This function may return None if the system does not find a device at
+        the specified address.  If `domain` is None, the first domain with a
+        device at that address wins.
+        """
+        self._ensure_index()
+        domains = self._domains if domain is None else (domain,)
+        for dom in domains:
+            dev = self._by_address.get((dom, bus, device, function))
+            if dev is not None:
+                return dev
+        return None
+
+    def domains(self):
+        """
+        Return the domains (PCI segments) that have devices, in order.
+        """
+        self._ensure_index()
+        return list(self._domains)
+
+    def devices_in_domain(self, domain):
+        self._ensure_index()
+        return list(self._by_domain.get(domain, ()))
+
+    def segment_stats(self):
+        """
+        Return `{domain: SegmentStats}` for every domain with devices.
+        """
+        self._ensure_index()
+        buses = {}
+        for domain, bus, _, _ in self._by_address:
+            buses.setdefault(domain, set()).add(bus)
+        return {domain: SegmentStats(len(self._by_domain[domain]), len(seen), min(seen), max(seen))
+                for domain, seen in buses.items()}
+
+    def idents(self):
+        """
+        Return `{(domain, bus, dev, func): (vendor_id, device_id)}` as of the
+        last scan.
+        """
+        self._ensure_index()
+        return dict(self._idents)
+
+    def watch(self, **kwargs):
+        """
+        Return a `DeviceWatcher` for this backend; see `chipset.pci.watch`.
+        """
+        from .watch import DeviceWatcher
+        return DeviceWatcher(self, **kwargs)
+
+    def find_devices(self, vendor_id, device_id):
+        self._ensure_index()
+        return list(self._by_id.get((vendor_id, device_id), ()))
+
+    def find_devices_by_class(self, device_class):
+        self._ensure_index()
+        return list(self._by_class.get(device_class, ()))
+
+    def capability_offsets(self, cap_id, cap_type):
+        """
+        Return `{(domain, bus, dev, func): [offsets]}` for every device that
+        has the given capability.
+        """
+        self._ensure_index()
+        res = {}
+        for key, dev in self._by_address.items():
+            offsets = dev.capability_offsets(cap_id, cap_type)
+            if offsets:
+                res[key] = offsets
+        return res
+
+class BaseDevice:
+    """
+    Subclasses implement `_hw_read_byte/word/long(pos)`,
+    `_hw_read_into(pos, view)` (returning success),
+    `_hw_write_byte/word/long(pos, value)` and `_hw_write_block(pos, view)`
+    (returning success).
+    """
+    def __init__(self, access=None):
+        self.access = access
+        self.config = None
+        self._dirty = set()
+        self._cap_index = None
+
+    @property
+    def next(self):
+        """
+        The following device in the access's enumeration order, or None.
+        """
+        if self.access is None:
+            return None
+        return self.access._next_device(self)
+
+    def clear_cache(self):
+        self._cap_index = None
+
+    def snapshot(self):
+        """
+        Return whatever device information the backend provides as a
+        `DeviceInfo`.
+        """
+        fields = {}
+        for name in DeviceInfo.__slots__:
+            value = getattr(self, name, None)
+            fields[name] = tuple(value) if isinstance(value, list) else value
+        return DeviceInfo(**fields)
+
+    def load_config(self, size=256):
+        """
+        Read the whole configuration space (256 or 4096 bytes) with one block
+        read.  Until `invalidate` is called, reads inside it are served from
+        the buffer and writes only update the buffer; `flush` writes them
+        back.  Returns the buffer, or None if the read failed.
+        """
+        if size not in CONFIG_SIZES:
+            raise ValueError("config size must be one of %r" % (CONFIG_SIZES,))
+        buf = bytearray(size)
+        if not self._hw_read_into(0, memoryview(buf)):
+            return None
+        self.config = buf
+        self._dirty = set()
+        return buf
+
+    def _buffered(self, pos, length):
+        return self.config is not None and 0 <= pos and pos + length <= len(self.config)
+
+    def _mark_dirty(self, pos, length):
+        self._dirty.update(range(pos, pos + length))
+
+    def flush(self):
+        """
+        Write every changed byte of the loaded configuration buffer back to
+        the device.  Each contiguous run of changed bytes is covered with
+        the widest naturally aligned writes that stay inside it, so
+        neighbouring registers (e.g. write-1-to-clear status bits next to a
+        command register) are never rewritten.
+        """
+        ok = True
+        dirty = sorted(self._dirty)
+        for _, run in itertools.groupby(enumerate(dirty), key=lambda x: x[1] - x[0]):
+            run = [pos for _, pos in run]
+            pos, end = run[0], run[-1] + 1
+            while pos < end:
+                if pos % 4 == 0 and end - pos >= 4:
+                    ok &= self._hw_write_long(pos, _U32.unpack_from(self.config, pos)[0])
+                    pos += 4
+                elif pos % 2 == 0 and end - pos >= 2:
+                    ok &= self._hw_write_word(pos, _U16.unpack_from(self.config, pos)[0])
+                    pos += 2
+                else:
+                    ok &= self._hw_write_byte(pos, self.config[pos])
+                    pos += 1
+        self._dirty.clear()
+        return ok
+
+    def invalidate(self, pos=None, length=None):
+        """
+        With no arguments, drop the configuration buffer (and any unflushed
+        writes).  Otherwise reread `length` bytes at `pos` from the device,
+        e.g. for volatile status registers, discarding pending writes there.
+        """
+        self._cap_index = None
+        if pos is None:
+            self.config = None
+            self._dirty.clear()
+            return
+        if not self._buffered(pos, length):
+            raise ValueError("range is not inside the loaded configuration space")
+        self._hw_read_into(pos, memoryview(self.config)[pos:pos + length])
+        self._dirty.difference_update(range(pos, pos + length))
+
+    @property
+    def capability_index(self):
+        """
+        A `CapabilityIndex` of standard and extended capabilities, built once
+        from a single snapshot of the configuration space (the loaded buffer
+        if there is one) and dropped by `invalidate`.
+        """
+        if self._cap_index is None:
+            config = self.config
+            if config is None:
+                config = self.read_block(0, 4096) or self.read_block(0, 256) or b""
+            self._cap_index = CapabilityIndex(config)
+        return self._cap_index
+
+    def capability_offsets(self, cap_id, cap_type):
+        return self.capability_index.offsets(cap_id, cap_type)
+
+    def find_capability_offset(self, cap_id, cap_type):
+        return self.capability_index.find(cap_id, cap_type)
+
+    @property
+    def first_cap(self):
+        return IndexedCapability.first(self.capability_index)
+
+    def find_capability(self, cap_id, cap_type):
+        """
+        Return the first matching capability (with `id`, `type`, `addr` and
+        `next`), or None.
+        """
+        index = self.capability_index
+        for pos, (entry_id, entry_type, _) in enumerate(index.entries):
+            if entry_id == cap_id and entry_type == cap_type:
+                return IndexedCapability(index, pos)
+        return None
+
+    def map_bar(self, index, writeable=True, sysfs_root=SYSFS_ROOT):
+        """
+        Map memory BAR `index` and return a `BarMapping`.  The sysfs
+        `resourceN` file is used when it exists; otherwise the BAR address
+        and size reported by the backend are mapped through /dev/mem.
+        """
+        from .bar import BarMapping
+        name = "%04x:%02x:%02x.%d" % (self.domain, self.bus, self.dev, self.func)
+        path = os.path.join(sysfs_root, name, "resource%d" % (index,))
+        if os.path.exists(path):
+            return BarMapping(path, 0, os.path.getsize(path), writeable=writeable)
+        base_addr = getattr(self, "base_addr", None)
+        sizes = getattr(self, "sizes", None)
+        if not base_addr or not sizes or not sizes[index]:
+            raise ValueError("can't locate BAR %d of %s" % (index, name))
+        if base_addr[index] & PCI_BASE_ADDRESS_SPACE_IO:
+            raise ValueError("BAR %d of %s is an I/O BAR" % (index, name))
+        return BarMapping("/dev/mem", base_addr[index] & PCI_BASE_ADDRESS_MEM_MASK,
+                          sizes[index], writeable=writeable)
+
+    def read_byte(self, pos):
+        if self._buffered(pos, 1):
+            return self.config[pos]
+        return self._hw_read_byte(pos)
+
+    def read_word(self, pos):
+        if self._buffered(pos, 2):
+            return _U16.unpack_from(self.config, pos)[0]
+        return self._hw_read_word(pos)
+
+    def read_long(self, pos):
+        if self._buffered(pos, 4):
+            return _U32.unpack_from(self.config, pos)[0]
+        return self._hw_read_long(pos)
+
+    def read_block(self, pos, length):
+        if self._buffered(pos, length):
+            return bytes(self.config[pos:pos + length])
+        buf = bytearray(length)
+        if not self._hw_read_into(pos, memoryview(buf)):
+            return None
+        return bytes(buf)
+
+    def read_block_into(self, pos, buffer):
+        """
+        Read `len(buffer)` bytes at `pos` straight into any writable,
+        contiguous buffer (bytearray, memoryview, NumPy array, ...).  Returns
+        the number of bytes read, or None on failure.
+        """
+        view = memoryview(buffer).cast("B")
+        length = len(view)
+        if self._buffered(pos, length):
+            view[:] = memoryview(self.config)[pos:pos + length]
+            return length
+        if not self._hw_read_into(pos, view):
+            return None
+        return length
+
+    def write_byte(self, pos, byte):
+        if self._buffered(pos, 1):
+            self.config[pos] = byte
+            self._mark_dirty(pos, 1)
+            return True
+        return self._hw_write_byte(pos, byte)
+
+    def write_word(self, pos, word):
+        if self._buffered(pos, 2):
+            _U16.pack_into(self.config, pos, word)
+            self._mark_dirty(pos, 2)
+            return True
+        return self._hw_write_word(pos, word)
+
+    def write_long(self, pos, long):
+        if self._buffered(pos, 4):
+            _U32.pack_into(self.config, pos, long)
+            self._mark_dirty(pos, 4)
+            return True
+        return self._hw_write_long(pos, long)
+
+    def write_long_unbuffered(self, pos, long):
+        """
+        Write straight to the device even if the configuration space is
+        loaded, e.g. to clear write-1-to-clear status bits at once.  The
+        buffered copy is left as it is; `invalidate` the range to reread it.
+        """
+        return self._hw_write_long(pos, long)
+
+    def write_block(self, pos, data):
+        data = bytes(data)
+        if self._buffered(pos, len(data)):
+            self.config[pos:pos + len(data)] = data
+            self._mark_dirty(pos, len(data))
+            return True
+        return self._hw_write_block(pos, memoryview(data))
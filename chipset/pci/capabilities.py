@@ -0,0 +1,95 @@
+"""
+Capability list walking over raw configuration space bytes.
+"""
+import struct
+from .regs import (PCI_CAPABILITY_LIST, PCI_CAP_EXTENDED, PCI_CAP_NORMAL,
+                   PCI_CB_CAPABILITY_LIST, PCI_HEADER_TYPE, PCI_HEADER_TYPE_CARDBUS,
+                   PCI_HEADER_TYPE_MASK, PCI_STATUS, PCI_STATUS_CAP_LIST)
+
+
+EXTENDED_START = 0x100
+
+def walk_capabilities(config):
+    """
+    Yield `(cap_id, cap_type, offset)` for every standard capability and, if
+    `config` covers the extended space, every extended capability, in list
+    order.  Malformed or looping lists are cut short rather than raising.
+    """
+    config = bytes(config)
+    if len(config) < 64:
+        return
+    status = struct.unpack_from("<H", config, PCI_STATUS)[0]
+    if status != 0xffff and status & PCI_STATUS_CAP_LIST:
+        if config[PCI_HEADER_TYPE] & PCI_HEADER_TYPE_MASK == PCI_HEADER_TYPE_CARDBUS:
+            pos = config[PCI_CB_CAPABILITY_LIST] & ~3
+        else:
+            pos = config[PCI_CAPABILITY_LIST] & ~3
+        seen = set()
+        while 0x40 <= pos < min(len(config), 0x100) - 1 and pos not in seen:
+            seen.add(pos)
+            cap_id, nxt = config[pos], config[pos + 1]
+            if cap_id == 0xff:
+                break
+            yield cap_id, PCI_CAP_NORMAL, pos
+            pos = nxt & ~3
+    if len(config) <= EXTENDED_START:
+        return
+    pos = EXTENDED_START
+    seen = set()
+    while EXTENDED_START <= pos <= len(config) - 4 and pos not in seen:
+        seen.add(pos)
+        header = struct.unpack_from("<I", config, pos)[0]
+        if header in (0, 0xffffffff):
+            break
+        yield header & 0xffff, PCI_CAP_EXTENDED, pos
+        pos = (header >> 20) & 0xffc
+
+class CapabilityIndex:
+    """
+    Maps (cap_id, cap_type) to the offsets of every matching capability,
+    duplicates included, in list order.
+    """
+    def __init__(self, config):
+        self.entries = list(walk_capabilities(config))
+        self._by_key = {}
+        for cap_id, cap_type, offset in self.entries:
+            self._by_key.setdefault((cap_id, cap_type), []).append(offset)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self._by_key
+
+    def offsets(self, cap_id, cap_type=PCI_CAP_NORMAL):
+        return list(self._by_key.get((cap_id, cap_type), ()))
+
+    def find(self, cap_id, cap_type=PCI_CAP_NORMAL):
+        """
+        Return the offset of the first matching capability, or None.
+        """
+        offsets = self._by_key.get((cap_id, cap_type))
+        return offsets[0] if offsets else None
+
+class IndexedCapability:
+    """
+    One entry of a `CapabilityIndex`, shaped like libpci's capability list:
+    `id`, `type`, `addr` and `next` (None after the last entry).
+    """
+    def __init__(self, index, pos):
+        self.index = index
+        self.pos = pos
+        self.id, self.type, self.addr = index.entries[pos]
+
+    @classmethod
+    def first(cls, index):
+        return cls(index, 0) if index.entries else None
+
+    @property
+    def next(self):
+        if self.pos + 1 >= len(self.index.entries):
+            return None
+        return IndexedCapability(self.index, self.pos + 1)
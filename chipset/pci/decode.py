@@ -0,0 +1,190 @@
+"""
+Decode raw PCI configuration space (256 or 4096 bytes) into typed records.
+
+Saved configuration dumps (raw images or `lspci -x`/`-xxx`/`-xxxx`
+output) can be analysed offline as well as live devices.
+"""
+import re
+import struct
+from collections import namedtuple
+from .capabilities import walk_capabilities
+from .regs import (PCI_CAP_EXTENDED, PCI_CAP_ID_EXP, PCI_CAP_ID_MSI, PCI_CAP_ID_MSIX,
+                   PCI_CAP_ID_PM, PCI_CAP_NORMAL, PCI_EXP_FLAGS_TYPE, PCI_EXT_CAP_ID_ERR,
+                   PCI_EXT_CAP_ID_SRIOV, PCI_HEADER_TYPE_BRIDGE, PCI_HEADER_TYPE_CARDBUS,
+                   PCI_HEADER_TYPE_MASK, PCI_HEADER_TYPE_NORMAL, PCI_MSIX_TABSIZE,
+                   PCI_MSI_FLAGS_64BIT, PCI_MSI_FLAGS_MASKBIT)
+
+
+HEADER_START = 0x10
+
+CommonHeader = namedtuple("CommonHeader", (
+    "vendor_id", "device_id", "command", "status", "revision_id", "prog_if",
+    "subclass", "base_class", "cache_line_size", "latency_timer", "header_type", "bist"))
+NormalHeader = namedtuple("NormalHeader", (
+    "base_address", "cardbus_cis", "subsystem_vendor_id", "subsystem_id",
+    "rom_address", "capability_list", "interrupt_line", "interrupt_pin",
+    "min_gnt", "max_lat"))
+BridgeHeader = namedtuple("BridgeHeader", (
+    "base_address", "primary_bus", "secondary_bus", "subordinate_bus",
+    "sec_latency_timer", "io_base", "io_limit", "sec_status", "memory_base",
+    "memory_limit", "pref_memory_base", "pref_memory_limit", "pref_base_upper32",
+    "pref_limit_upper32", "io_base_upper16", "io_limit_upper16", "capability_list",
+    "rom_address", "interrupt_line", "interrupt_pin", "bridge_control"))
+CardbusHeader = namedtuple("CardbusHeader", (
+    "socket_base", "capability_list", "sec_status", "primary_bus", "card_bus",
+    "subordinate_bus", "latency_timer", "memory_base_0", "memory_limit_0",
+    "memory_base_1", "memory_limit_1", "io_base_0", "io_limit_0", "io_base_1",
+    "io_limit_1", "interrupt_line", "interrupt_pin", "bridge_control",
+    "subsystem_vendor_id", "subsystem_id", "legacy_mode_base"))
+
+PMCapability = namedtuple("PMCapability", ("pmc", "control", "bridge_ext", "data"))
+MSICapability = namedtuple("MSICapability", (
+    "control", "address", "data", "mask", "pending", "is_64bit", "vectors_capable",
+    "enabled"))
+MSIXCapability = namedtuple("MSIXCapability", (
+    "control", "table_size", "table_bir", "table_offset", "pba_bir", "pba_offset",
+    "enabled", "function_mask"))
+PCIeCapability = namedtuple("PCIeCapability", (
+    "flags", "port_type", "devcap", "devctl", "devsta", "lnkcap", "lnkctl", "lnksta",
+    "sltcap", "sltctl", "sltsta", "rtctl", "rtcap", "rtsta"))
+AERCapability = namedtuple("AERCapability", (
+    "uncor_status", "uncor_mask", "uncor_sever", "cor_status", "cor_mask", "cap_ctrl",
+    "header_log", "root_command", "root_status", "cor_err_source", "err_source"))
+SRIOVCapability = namedtuple("SRIOVCapability", (
+    "cap", "ctrl", "status", "initial_vfs", "total_vfs", "num_vfs", "func_link",
+    "vf_offset", "vf_stride", "vf_device", "supported_page_sizes", "system_page_size",
+    "base_address", "migration_state"))
+
+Capability = namedtuple("Capability", ("id", "type", "offset", "record"))
+DecodedConfig = namedtuple("DecodedConfig", ("header", "body", "capabilities"))
+
+COMMON_LAYOUT = struct.Struct("<HHHHBBBBBBBB")
+HEADER_LAYOUTS = {
+    PCI_HEADER_TYPE_NORMAL: struct.Struct("<6IIHHIB7xBBBB"),
+    PCI_HEADER_TYPE_BRIDGE: struct.Struct("<IIBBBBBBHHHHHIIHHB3xIBBH"),
+    PCI_HEADER_TYPE_CARDBUS: struct.Struct("<IBxHBBBBIIIIIIIIBBHHHI"),
+}
+PM_LAYOUT = struct.Struct("<2xHHBB")
+MSI_LAYOUTS = {
+    (False, False): struct.Struct("<2xHIH"),
+    (True, False): struct.Struct("<2xHQH"),
+    (False, True): struct.Struct("<2xHIH2xII"),
+    (True, True): struct.Struct("<2xHQH2xII"),
+}
+MSIX_LAYOUT = struct.Struct("<2xHII")
+EXP_LAYOUT = struct.Struct("<2xHIHHIHHIHHHHI")
+ERR_LAYOUT = struct.Struct("<4x6I16sIIHH")
+SRIOV_LAYOUT = struct.Struct("<4xIHHHHHBxHH2xHII6II")
+
+def decode_common(config):
+    return CommonHeader(*COMMON_LAYOUT.unpack_from(config, 0))
+
+def decode_body(config, header_type):
+    """
+    Decode the type-specific part of the header, or return None if the
+    type is not known or the image is too short for it (a CardBus header
+    runs past the 64 bytes of `lspci -x`).
+    """
+    header_type &= PCI_HEADER_TYPE_MASK
+    if header_type not in HEADER_LAYOUTS:
+        return None
+    try:
+        fields = HEADER_LAYOUTS[header_type].unpack_from(config, HEADER_START)
+    except struct.error:
+        return None
+    if header_type == PCI_HEADER_TYPE_NORMAL:
+        return NormalHeader(fields[:6], *fields[6:])
+    if header_type == PCI_HEADER_TYPE_BRIDGE:
+        return BridgeHeader(fields[:2], *fields[2:])
+    return CardbusHeader(*fields)
+
+def _decode_pm(config, pos):
+    return PMCapability(*PM_LAYOUT.unpack_from(config, pos))
+
+def _decode_msi(config, pos):
+    control = struct.unpack_from("<H", config, pos + 2)[0]
+    is_64 = bool(control & PCI_MSI_FLAGS_64BIT)
+    masking = bool(control & PCI_MSI_FLAGS_MASKBIT)
+    fields = MSI_LAYOUTS[(is_64, masking)].unpack_from(config, pos)
+    mask, pending = fields[3:] if masking else (None, None)
+    return MSICapability(control, fields[1], fields[2], mask, pending, is_64,
+                         1 << ((control >> 1) & 7), bool(control & 1))
+
+def _decode_msix(config, pos):
+    control, table, pba = MSIX_LAYOUT.unpack_from(config, pos)
+    return MSIXCapability(control, (control & PCI_MSIX_TABSIZE) + 1, table & 7, table & ~7,
+                          pba & 7, pba & ~7, bool(control & 0x8000), bool(control & 0x4000))
+
+def _decode_exp(config, pos):
+    fields = EXP_LAYOUT.unpack_from(config, pos)
+    return PCIeCapability(fields[0], (fields[0] & PCI_EXP_FLAGS_TYPE) >> 4, *fields[1:])
+
+def _decode_err(config, pos):
+    return AERCapability(*ERR_LAYOUT.unpack_from(config, pos))
+
+def _decode_sriov(config, pos):
+    fields = SRIOV_LAYOUT.unpack_from(config, pos)
+    return SRIOVCapability(*fields[:12], fields[12:18], fields[18])
+
+DECODERS = {
+    (PCI_CAP_ID_PM, PCI_CAP_NORMAL): _decode_pm,
+    (PCI_CAP_ID_MSI, PCI_CAP_NORMAL): _decode_msi,
+    (PCI_CAP_ID_MSIX, PCI_CAP_NORMAL): _decode_msix,
+    (PCI_CAP_ID_EXP, PCI_CAP_NORMAL): _decode_exp,
+    (PCI_EXT_CAP_ID_ERR, PCI_CAP_EXTENDED): _decode_err,
+    (PCI_EXT_CAP_ID_SRIOV, PCI_CAP_EXTENDED): _decode_sriov,
+}
+
+def decode_capability(config, cap_id, cap_type, offset):
+    """
+    Decode the capability at `offset`, or return None if its type is not
+    known or it runs off the end of `config`.
+    """
+    if (cap_id, cap_type) not in DECODERS:
+        return None
+    if cap_type == PCI_CAP_NORMAL:
+        config = config[:0x100]
+    try:
+        return DECODERS[(cap_id, cap_type)](config, offset)
+    except struct.error:
+        return None
+
+def decode(config):
+    """
+    Decode the header and every capability of a configuration space image.
+    """
+    config = bytes(config)
+    if len(config) < 64:
+        raise ValueError("configuration space image must be at least 64 bytes")
+    header = decode_common(config)
+    body = decode_body(config, header.header_type)
+    caps = [Capability(cap_id, cap_type, offset,
+                       decode_capability(config, cap_id, cap_type, offset))
+            for cap_id, cap_type, offset in walk_capabilities(config)]
+    return DecodedConfig(header, body, caps)
+
+_SLOT_LINE = re.compile(r"^(?:([0-9a-fA-F]{4,8}):)?([0-9a-fA-F]{2}):([0-9a-fA-F]{2})\.([0-7])\b")
+_DATA_LINE = re.compile(r"^([0-9a-fA-F]{2,3}):((?: [0-9a-fA-F]{2})+)\s*$")
+
+def parse_lspci_dump(text):
+    """
+    Parse `lspci -x`-style hex dumps into `{(domain, bus, dev, func): bytes}`.
+    """
+    devices = {}
+    current = None
+    for line in text.splitlines():
+        data = _DATA_LINE.match(line)
+        if data is not None and current is not None:
+            off = int(data.group(1), 16)
+            chunk = bytes.fromhex(data.group(2))
+            buf = devices[current]
+            if len(buf) < off + len(chunk):
+                buf.extend(bytes(off + len(chunk) - len(buf)))
+            buf[off:off + len(chunk)] = chunk
+            continue
+        slot = _SLOT_LINE.match(line)
+        if slot is not None:
+            domain = int(slot.group(1), 16) if slot.group(1) else 0
+            current = (domain,) + tuple(int(g, 16) for g in slot.group(2, 3, 4))
+            devices[current] = bytearray()
+    return {key: bytes(buf) for key, buf in devices.items()}
@@ -0,0 +1,276 @@
+"""
+Memory-mapped (ECAM/MMCONFIG) configuration space access.
+
+Each bus's 1 MiB window is mapped through /dev/mem (or any file laid out in
+ECAM format) on first use, so config reads and writes are plain loads and
+stores covering the full 4 KiB extended space.  Devices may be used from
+several threads at once.
+"""
+import os
+import mmap
+import struct
+import threading
+from collections import namedtuple
+from .base import BaseAccess, BaseDevice
+from .regs import PCI_VENDOR_ID, PCI_DEVICE_ID, PCI_CLASS_DEVICE
+
+
+MCFG_PATH = "/sys/firmware/acpi/tables/MCFG"
+MCFG_HEADER_SIZE = 44
+BUS_WINDOW_SIZE = 1 << 20
+FUNC_WINDOW_SIZE = 1 << 12
+
+McfgEntry = namedtuple("McfgEntry", ("base", "segment", "start_bus", "end_bus"))
+
+_MCFG_ENTRY = struct.Struct("<QHBB4x")
+_U32 = struct.Struct("<I")
+
+def read_mcfg(path=MCFG_PATH):
+    """
+    Parse the ACPI MCFG table into a list of `McfgEntry`s.
+    """
+    with open(path, "rb") as f:
+        table = f.read()
+    return [McfgEntry(*_MCFG_ENTRY.unpack_from(table, off))
+            for off in range(MCFG_HEADER_SIZE, len(table) - _MCFG_ENTRY.size + 1,
+                             _MCFG_ENTRY.size)]
+
+class ECAM(BaseAccess):
+    """
+    ECAM access to one or more PCI segments.
+
+    If `base` is None, the segment's windows are looked up in the ACPI MCFG
+    table, which may split a segment into several entries covering disjoint
+    bus ranges; with `segment=None` as well, every segment in the table is
+    covered.  An MCFG base is the address of bus 0's window, even for
+    entries that start at a higher bus.  An explicit `base` is the address
+    of `start_bus`'s window instead, so that `path` may point at a file
+    image that begins with `start_bus` (usually at offset 0).
+    With `scan=False` the segments are probed on first use instead.
+    """
+    parallel = True
+
+    def __init__(self, base=None, segment=0, start_bus=0, end_bus=None,
+                 path="/dev/mem", mcfg_path=MCFG_PATH, scan=True):
+        if base is not None:
+            if segment is None:
+                raise ValueError("an explicit base needs a segment")
+            # Store regions in MCFG form: base is where bus 0 would be.
+            regions = [McfgEntry(base - start_bus * BUS_WINDOW_SIZE, segment, start_bus,
+                                 255 if end_bus is None else end_bus)]
+        else:
+            regions = [entry for entry in read_mcfg(mcfg_path)
+                       if segment is None or entry.segment == segment]
+            if not regions:
+                raise ValueError("no MCFG entry for segment %r" % (segment,))
+            if end_bus is not None:
+                regions = [entry._replace(end_bus=min(entry.end_bus, end_bus))
+                           for entry in regions]
+        # `{segment: [McfgEntry, ...]}`, each list in bus order.
+        self.regions = {}
+        for entry in sorted(regions, key=lambda entry: (entry.segment, entry.start_bus)):
+            covered = self.regions.setdefault(entry.segment, [])
+            if covered and entry.start_bus <= covered[-1].end_bus:
+                raise ValueError("overlapping MCFG entries for segment %d" % (entry.segment,))
+            covered.append(entry)
+        self.segment = segment
+        self.fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        self._windows = {}
+        self._map_lock = threading.Lock()
+        if scan:
+            self.rescan_bus()
+
+    def close(self):
+        with self._map_lock:
+            for window, views in self._windows.values():
+                for view in views:
+                    view.release()
+                window.close()
+            self._windows.clear()
+        os.close(self.fd)
+
+    def _segment(self, segment):
+        regions = self.regions.get(segment)
+        if regions is None:
+            raise ValueError("segment %d is not covered by this ECAM access" % (segment,))
+        return regions
+
+    def _region(self, segment, bus):
+        for region in self._segment(segment):
+            if region.start_bus <= bus <= region.end_bus:
+                return region
+        raise ValueError("bus %02x is outside the ECAM regions of segment %d" % (bus, segment))
+
+    def _buses(self, segment):
+        return [bus for region in self._segment(segment)
+                for bus in range(region.start_bus, region.end_bus + 1)]
+
+    def _window(self, segment, bus):
+        """
+        Return `(mmap, (u8, u16, u32 views))` for a bus, mapping it on first use.
+        """
+        entry = self._windows.get((segment, bus))
+        if entry is not None:
+            return entry
+        with self._map_lock:
+            # Another thread may have mapped it while we waited.
+            entry = self._windows.get((segment, bus))
+            if entry is not None:
+                return entry
+            region = self._region(segment, bus)
+            offset = region.base + bus * BUS_WINDOW_SIZE
+            window = mmap.mmap(self.fd, BUS_WINDOW_SIZE, offset=offset)
+            raw = memoryview(window)
+            entry = self._windows[(segment, bus)] = (window, (raw, raw.cast("H"), raw.cast("I")))
+            return entry
+
+    def rescan_bus(self, buses=None, domain=None):
+        """
+        Probe every segment, or only segment `domain`, or with `buses` only
+        those buses of `domain` (which may be omitted if there is only one
+        segment).
+        """
+        if buses is None and domain is None:
+            self._build_index(entry for segment in sorted(self.regions)
+                              for entry in self._probe_segment(segment))
+            return
+        if domain is None:
+            if len(self.regions) != 1:
+                raise ValueError("a domain is needed to rescan buses of several segments")
+            domain, = self.regions
+        self._segment(domain)
+        buses = set(self._buses(domain) if buses is None else buses)
+        self._merge_index(domain, buses, self._probe_buses(domain, sorted(buses)))
+
+    def _probe_segment(self, segment):
+        return self._probe_buses(segment, self._buses(segment))
+
+    def get_device(self, domain, bus, device, function):
+        """
+        This function will always return a device object, even if there is
+        no device at the corresponding address, unless the segment isn't
+        covered.
+        """
+        if domain not in self.regions:
+            return None
+        return ECAMDevice(self, domain, bus, device, function)
+
+class ECAMDevice(BaseDevice):
+    def __init__(self, ecam, domain, bus, dev, func):
+        super().__init__(ecam)
+        self.domain = domain
+        self.bus = bus
+        self.dev = dev
+        self.func = func
+        _, (self._u8, self._u16, self._u32) = ecam._window(domain, bus)
+        self._base = (dev << 15) | (func << 12)
+
+    @property
+    def vendor_id(self):
+        return self.read_word(PCI_VENDOR_ID)
+
+    @property
+    def device_id(self):
+        return self.read_word(PCI_DEVICE_ID)
+
+    @property
+    def device_class(self):
+        return self.read_word(PCI_CLASS_DEVICE)
+
+    def _check(self, pos, length):
+        """
+        Return the window offset of an access, or None if it leaves the
+        function's 4 KiB configuration space.  Like libpci and sysfs, such
+        reads give all ones and such writes fail.
+        """
+        if pos < 0 or pos + length > FUNC_WINDOW_SIZE:
+            return None
+        return self._base + pos
+
+    # Naturally aligned accesses go through typed views so that each one is
+    # a single load or store of the requested width.  Blocks are copied one
+    # element at a time, never with a slice copy, which becomes a memcpy
+    # of unspecified access width.
+
+    def _hw_read_byte(self, pos):
+        addr = self._check(pos, 1)
+        if addr is None:
+            return 0xff
+        return self._u8[addr]
+
+    def _hw_read_word(self, pos):
+        addr = self._check(pos, 2)
+        if addr is None:
+            return 0xffff
+        if addr % 2:
+            return struct.unpack_from("<H", self._u8, addr)[0]
+        return self._u16[addr >> 1]
+
+    def _hw_read_long(self, pos):
+        addr = self._check(pos, 4)
+        if addr is None:
+            return 0xffffffff
+        if addr % 4:
+            return struct.unpack_from("<I", self._u8, addr)[0]
+        return self._u32[addr >> 2]
+
+    def _hw_read_into(self, pos, view):
+        addr = self._check(pos, len(view))
+        if addr is None:
+            return False
+        end = addr + len(view)
+        out = 0
+        while addr < end:
+            if addr % 4 == 0 and end - addr >= 4:
+                _U32.pack_into(view, out, self._u32[addr >> 2])
+                addr += 4
+                out += 4
+            else:
+                view[out] = self._u8[addr]
+                addr += 1
+                out += 1
+        return True
+
+    def _hw_write_byte(self, pos, byte):
+        addr = self._check(pos, 1)
+        if addr is None:
+            return False
+        self._u8[addr] = byte
+        return True
+
+    def _hw_write_word(self, pos, word):
+        addr = self._check(pos, 2)
+        if addr is None:
+            return False
+        if addr % 2:
+            struct.pack_into("<H", self._u8, addr, word)
+        else:
+            self._u16[addr >> 1] = word
+        return True
+
+    def _hw_write_long(self, pos, long):
+        addr = self._check(pos, 4)
+        if addr is None:
+            return False
+        if addr % 4:
+            struct.pack_into("<I", self._u8, addr, long)
+        else:
+            self._u32[addr >> 2] = long
+        return True
+
+    def _hw_write_block(self, pos, view):
+        addr = self._check(pos, len(view))
+        if addr is None:
+            return False
+        end = addr + len(view)
+        src = 0
+        while addr < end:
+            if addr % 4 == 0 and end - addr >= 4:
+                self._u32[addr >> 2] = _U32.unpack_from(view, src)[0]
+                addr += 4
+                src += 4
+            else:
+                self._u8[addr] = view[src]
+                addr += 1
+                src += 1
+        return True
@@ -0,0 +1,8 @@
+"""
+The kinds of device changes reported by hotplug watching and inventory
+diffs.  Kept apart so either can be used without importing the other.
+"""
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
@@ -0,0 +1,130 @@
+"""
+A pure-Python index over the pci.ids database.
+
+The file is memory-mapped and only the vendor and class headers are
+located up front; a vendor's device and subsystem entries are parsed the
+first time that vendor is looked up.
+"""
+import os
+import re
+import mmap
+
+
+PCI_IDS_PATHS = ("/usr/share/hwdata/pci.ids", "/usr/share/misc/pci.ids",
+                 "/usr/share/pci.ids")
+
+_VENDOR = re.compile(rb"^([0-9a-fA-F]{4})  (.*?)\r?$", re.M)
+_CLASS = re.compile(rb"^C ([0-9a-fA-F]{2})  (.*?)\r?$", re.M)
+_ENTRY = re.compile(rb"^(\t+)([0-9a-fA-F]{2,4})(?: ([0-9a-fA-F]{4}))?  (.*?)\r?$")
+
+def find_pci_ids():
+    for path in PCI_IDS_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+class PciIds:
+    def __init__(self, path=None):
+        if path is None:
+            path = find_pci_ids()
+        if path is None:
+            raise FileNotFoundError("no pci.ids database found")
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._vendors = None
+        self._classes = None
+        self._parsed = {}
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_t, ex_v, ex_tb):
+        self.close()
+        return False
+
+    def _index(self):
+        if self._vendors is None:
+            vendors = {}
+            classes = {}
+            for m in _VENDOR.finditer(self._map):
+                vendors[int(m.group(1), 16)] = (m.group(2), m.end())
+            for m in _CLASS.finditer(self._map):
+                classes[int(m.group(1), 16)] = (m.group(2), m.end())
+            self._vendors, self._classes = vendors, classes
+
+    def _section(self, table, key):
+        """
+        Parse the indented lines below a vendor or class header into
+        `(name, {child_id: (name, {grandchild_key: name})})`.
+        """
+        cache_key = (table is self._classes, key)
+        if cache_key in self._parsed:
+            return self._parsed[cache_key]
+        if key not in table:
+            return None
+        name, pos = table[key]
+        children = {}
+        current = None
+        size = len(self._map)
+        pos += 1
+        while pos < size:
+            end = self._map.find(b"\n", pos)
+            if end < 0:
+                end = size
+            line = self._map[pos:end]
+            pos = end + 1
+            if not line.strip() or line.startswith(b"#"):
+                continue
+            m = _ENTRY.match(line)
+            if m is None:
+                break
+            depth, first, second, entry = m.groups()
+            entry = entry.decode("utf-8", "replace")
+            if len(depth) == 1:
+                current = children[int(first, 16)] = (entry, {})
+            elif current is not None:
+                sub = (int(first, 16), int(second, 16)) if second else int(first, 16)
+                current[1][sub] = entry
+        res = self._parsed[cache_key] = (name.decode("utf-8", "replace"), children)
+        return res
+
+    def vendor(self, vendor_id):
+        self._index()
+        entry = self._vendors.get(vendor_id)
+        return None if entry is None else entry[0].decode("utf-8", "replace")
+
+    def device(self, vendor_id, device_id):
+        self._index()
+        section = self._section(self._vendors, vendor_id)
+        if section is None or device_id not in section[1]:
+            return None
+        return section[1][device_id][0]
+
+    def subsystem(self, vendor_id, device_id, subvendor_id, subdevice_id):
+        self._index()
+        section = self._section(self._vendors, vendor_id)
+        if section is None or device_id not in section[1]:
+            return None
+        return section[1][device_id][1].get((subvendor_id, subdevice_id))
+
+    def device_class(self, device_class):
+        """
+        Name a 16-bit class code (base class and subclass), falling back to
+        the base class name.
+        """
+        self._index()
+        section = self._section(self._classes, device_class >> 8)
+        if section is None:
+            return None
+        sub = section[1].get(device_class & 0xff)
+        return section[0] if sub is None else sub[0]
+
+    def prog_if(self, device_class, prog_if):
+        self._index()
+        section = self._section(self._classes, device_class >> 8)
+        if section is None or (device_class & 0xff) not in section[1]:
+            return None
+        return section[1][device_class & 0xff][1].get(prog_if)
@@ -0,0 +1,159 @@
+"""
+Per-host hardware inventories and fast inventory diffs.
+
+An inventory holds one row per PCI function (address, IDs, class, BARs and
+sizes, NUMA node, capability offsets and optionally a hash of the
+configuration space), stored column by column in a gzip-compressed,
+versioned JSON document.  Every row carries a short digest of its
+contents and the inventory carries a digest over all rows, so `diff`
+compares digests and only looks at the columns of rows that differ;
+identical hosts cost a single comparison.
+"""
+import gzip
+import json
+import socket
+import hashlib
+from collections import namedtuple
+from .capabilities import CapabilityIndex
+from .events import ADDED, REMOVED, CHANGED
+from .regs import (PCI_VENDOR_ID, PCI_DEVICE_ID, PCI_CLASS_DEVICE, PCI_BASE_ADDRESS_0,
+                   PCI_NUM_BARS)
+
+
+INVENTORY_FORMAT = "chipset-pci-inventory"
+INVENTORY_VERSION = 1
+COLUMNS = ("address", "vendor_id", "device_id", "device_class", "bars", "sizes",
+           "numa_node", "capabilities", "config_hash", "digest")
+# Columns that are compared (and hashed into the row digest).
+FIELDS = COLUMNS[1:-1]
+
+DIGEST_SIZE = 8
+
+Inventory = namedtuple("Inventory", ("host", "digest", "columns"))
+# `fields` names the columns that differ, for CHANGED rows only.
+Change = namedtuple("Change", ("kind", "address", "fields"))
+
+def _digest(value):
+    data = json.dumps(value, separators=(",", ":")).encode()
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).hexdigest()
+
+def _row(dev, size, config_hashes):
+    config = dev.read_block(0, size) or dev.read_block(0, 256)
+    if config is None:
+        return None
+    # Prefer the backend's decoded BARs (with sizes); fall back to the raw
+    # registers for backends that only have configuration space.
+    bars = getattr(dev, "base_addr", None)
+    sizes = getattr(dev, "sizes", None)
+    if bars is None:
+        bars = [int.from_bytes(config[off:off + 4], "little")
+                for off in range(PCI_BASE_ADDRESS_0, PCI_BASE_ADDRESS_0 + 4 * PCI_NUM_BARS, 4)]
+    row = {
+        "address": "%04x:%02x:%02x.%d" % (dev.domain, dev.bus, dev.dev, dev.func),
+        "vendor_id": config[PCI_VENDOR_ID] | config[PCI_VENDOR_ID + 1] << 8,
+        "device_id": config[PCI_DEVICE_ID] | config[PCI_DEVICE_ID + 1] << 8,
+        "device_class": config[PCI_CLASS_DEVICE] | config[PCI_CLASS_DEVICE + 1] << 8,
+        "bars": list(bars)[:PCI_NUM_BARS],
+        "sizes": None if sizes is None else list(sizes)[:PCI_NUM_BARS],
+        "numa_node": getattr(dev, "numa_node", None),
+        "capabilities": [list(entry) for entry in CapabilityIndex(config)],
+        "config_hash": hashlib.sha1(config).hexdigest() if config_hashes else None,
+    }
+    row["digest"] = _digest([row[name] for name in FIELDS])
+    return row
+
+def _inventory_digest(addresses, digests):
+    return _digest(sorted(zip(addresses, digests)))
+
+def collect_inventory(access, host=None, config_hashes=False, size=4096):
+    """
+    Build the `Inventory` of every device `access` knows about, with one
+    configuration space read per device.  With `config_hashes`, the SHA-1
+    of each function's configuration space (`size` bytes, or 256 if the
+    extended space can't be read) is recorded too.
+    """
+    columns = {name: [] for name in COLUMNS}
+    for dev in access:
+        row = _row(dev, size, config_hashes)
+        if row is None:
+            continue
+        for name in COLUMNS:
+            columns[name].append(row[name])
+    if host is None:
+        host = socket.gethostname()
+    return Inventory(host, _inventory_digest(columns["address"], columns["digest"]), columns)
+
+def write_inventory(f, inventory):
+    """
+    Write an inventory to a binary file object.
+    """
+    doc = {"format": INVENTORY_FORMAT, "version": INVENTORY_VERSION,
+           "host": inventory.host, "digest": inventory.digest,
+           "columns": inventory.columns}
+    f.write(gzip.compress(json.dumps(doc, separators=(",", ":")).encode(), mtime=0))
+
+def read_inventory(data):
+    """
+    Parse the bytes of an inventory file into an `Inventory`.
+    """
+    doc = json.loads(gzip.decompress(data))
+    if doc.get("format") != INVENTORY_FORMAT:
+        raise ValueError("not a PCI inventory")
+    if doc.get("version") != INVENTORY_VERSION:
+        raise ValueError("unsupported inventory version %r" % (doc.get("version"),))
+    columns = doc["columns"]
+    missing = set(COLUMNS) - set(columns)
+    if missing:
+        raise ValueError("inventory lacks columns %s" % (", ".join(sorted(missing)),))
+    return Inventory(doc["host"], doc["digest"], columns)
+
+def load_inventory(path):
+    with open(path, "rb") as f:
+        return read_inventory(f.read())
+
+def _index(inventory):
+    """
+    Map each address to `(digest, row)`.
+    """
+    return {address: (digest, idx) for idx, (address, digest)
+            in enumerate(zip(inventory.columns["address"], inventory.columns["digest"]))}
+
+def _diff(old, old_rows, new):
+    if old.digest == new.digest:
+        return []
+    new_rows = _index(new)
+    changes = []
+    for address, (digest, idx) in new_rows.items():
+        prev = old_rows.get(address)
+        if prev is None:
+            changes.append(Change(ADDED, address, ()))
+        elif prev[0] != digest:
+            fields = tuple(name for name in FIELDS
+                           if old.columns[name][prev[1]] != new.columns[name][idx])
+            changes.append(Change(CHANGED, address, fields))
+    for address in old_rows:
+        if address not in new_rows:
+            changes.append(Change(REMOVED, address, ()))
+    changes.sort(key=lambda change: change.address)
+    return changes
+
+def diff(old, new):
+    """
+    Return the `Change`s that turn inventory `old` into `new`, in address
+    order.
+    """
+    return _diff(old, _index(old), new)
+
+def diff_against(golden, inventories):
+    """
+    Diff each inventory against a golden reference and return
+    `{host: [Change, ...]}` for the hosts that differ.  The reference is
+    indexed once for all of them.
+    """
+    golden_rows = _index(golden)
+    res = {}
+    for inventory in inventories:
+        changes = _diff(golden, golden_rows, inventory)
+        if changes:
+            res[inventory.host] = changes
+    return res
@@ -1492,10 +1492,68 @@ enum pci_lookup_mode {
   PCI_LOOKUP_REFRESH_CACHE = 0x400000,	/* Forget all previously cached entries, but still allow updating the cache */
   PCI_LOOKUP_NO_HWDB = 0x800000,	/* Do not ask udev's hwdb */
 };
+
+/* chipset MMIO helpers */
+
+void chipset_mmio_read32(void *base, uint32_t *out, size_t count);
+void chipset_mmio_write32(void *base, uint32_t *in, size_t count);
+void chipset_mmio_rmw32(void *base, uint32_t *masks, uint32_t *values, size_t count);
+long chipset_mmio_poll32(void *base, uint32_t mask, uint32_t value,
+                         long max_polls, uint32_t *last);
 """)
 
+MMIO_HELPERS = """
+/*
+ * Bulk accessors for memory-mapped register windows.  Every access is a
+ * single volatile 32-bit load or store, in ascending address order.
+ */
+
+static void chipset_mmio_read32(void *base, uint32_t *out, size_t count)
+{
+  volatile uint32_t *regs = base;
+  size_t i;
+  for (i = 0; i < count; i++)
+    out[i] = regs[i];
+}
+
+static void chipset_mmio_write32(void *base, uint32_t *in, size_t count)
+{
+  volatile uint32_t *regs = base;
+  size_t i;
+  for (i = 0; i < count; i++)
+    regs[i] = in[i];
+}
+
+/* Bits set in masks[i] are preserved; the rest are taken from values[i]. */
+static void chipset_mmio_rmw32(void *base, uint32_t *masks, uint32_t *values, size_t count)
+{
+  volatile uint32_t *regs = base;
+  size_t i;
+  for (i = 0; i < count; i++)
+    regs[i] = (regs[i] & masks[i]) | (values[i] & ~masks[i]);
+}
+
+/* Returns the number of reads it took to see (*base & mask) == value, or -1. */
+static long chipset_mmio_poll32(void *base, uint32_t mask, uint32_t value,
+                                long max_polls, uint32_t *last)
+{
+  volatile uint32_t *reg = base;
+  long polls;
+  uint32_t cur = 0;
+  for (polls = 1; polls <= max_polls; polls++) {
+    cur = *reg;
+    if ((cur & mask) == value) {
+      *last = cur;
+      return polls;
+    }
+  }
+  *last = cur;
+  return -1;
+}
+"""
+
 builder.set_source("chipset.pci._libpci",
-                   "\n#include <pci/pci.h>\n",
+                   "\n#include <pci/pci.h>\n#include <stdint.h>\n#include <stddef.h>\n" + MMIO_HELPERS,
                    libraries=["pci"])
 
 def main():
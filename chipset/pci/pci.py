@@ -1,63 +1,217 @@
-import re
-import struct
-import argparse
+import functools
+import threading
+import contextlib
 from ._libpci import lib, ffi
+from .base import BaseAccess, BaseDevice, DeviceInfo
 
 
 constants = lib
 PCI_ADDR_SIZE = ffi.sizeof(ffi.cast("pciaddr_t", 0))
 
-class PCI:
-    def __init__(self, method=lib.PCI_ACCESS_AUTO):
+_NO_LOCK = contextlib.nullcontext()
+_shared = {}
+_shared_lock = threading.Lock()
+
+class ScratchPool:
+    """
+    Reusable cffi buffers for block reads, bucketed by power-of-two size.
+    """
+    MIN_SIZE = 64
+
+    def __init__(self, per_size=4):
+        self.per_size = per_size
+        self._free = {}
+
+    def acquire(self, length):
+        size = max(self.MIN_SIZE, 1 << (length - 1).bit_length())
+        try:
+            return self._free[size].pop()
+        except (KeyError, IndexError):
+            return ffi.new("u8[]", size)
+
+    def release(self, buf):
+        bucket = self._free.setdefault(len(buf), [])
+        if len(bucket) < self.per_size:
+            bucket.append(buf)
+
+class _Handle:
+    """
+    Shared by every `Device` wrapping a pci_dev this PCI object owns, and
+    cleared when the pci_dev is freed, so stale wrappers raise instead of
+    touching freed memory.
+    """
+    __slots__ = ("alive",)
+
+    def __init__(self):
+        self.alive = True
+
+class PCI(BaseAccess):
+    """
+    libpci keeps per-access state (cached file descriptors, the device list)
+    without any locking, so with `threadsafe=True` every libpci call made
+    through this object or its devices is serialised on `lock`.  The cffi
+    calls release the GIL, so other threads keep running meanwhile.  Use
+    `PCI.shared()` to scan once and share the result across a process.
+
+    With `scan=False` the bus is not scanned up front: direct lookups with
+    `get_device` never need it, and the first query that does (iterating,
+    `search_for_device`, `devices`, ...) triggers a full scan.
+    """
+    NAME_CACHE_SIZE = 4096
+    NAME_BUFFER_SIZE = 1024
+    threadsafe = False
+
+    def __init__(self, method=lib.PCI_ACCESS_AUTO, threadsafe=False, scan=True):
+        self.method = method
+        self.threadsafe = threadsafe
+        self.lock = threading.RLock() if threadsafe else _NO_LOCK
+        self.scratch = ScratchPool()
+        self._probed = {}
+        self._handles = {}
+        self._cached_lookup = functools.lru_cache(maxsize=self.NAME_CACHE_SIZE)(self._lookup)
         self.access = lib.pci_alloc()
         self.access.method = method
         lib.pci_init(self.access)
-        self.rescan_bus()
+        if scan:
+            self.rescan_bus()
 
-    def close(self):
-        lib.pci_cleanup(self.access)
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, ex_t, ex_v, ex_tb):
-        self.close()
-        return False
+    @classmethod
+    def shared(cls, method=lib.PCI_ACCESS_AUTO):
+        """
+        Return the process-wide thread-safe PCI object for `method`, creating
+        and scanning it on first use.
+        """
+        with _shared_lock:
+            pci = _shared.get(method)
+            if pci is None:
+                pci = _shared[method] = cls(method, threadsafe=True)
+            return pci
 
-    def rescan_bus(self):
-        lib.pci_scan_bus(self.access)
+    def close(self):
+        with _shared_lock:
+            if _shared.get(self.method) is self:
+                del _shared[self.method]
+        with self.lock:
+            self._free_probed(list(self._probed))
+            # pci_cleanup frees the scanned devices.
+            for handle in self._handles.values():
+                handle.alive = False
+            self._handles.clear()
+            lib.pci_cleanup(self.access)
+
+    def rescan_bus(self, buses=None, domain=None):
+        """
+        Rescan the bus and rebuild the device indices.  `Device` objects for
+        the devices that were rescanned (all of them after a full rescan)
+        raise ValueError once the rescan has freed them, in every thread.
+
+        If `buses` (an iterable of bus numbers, e.g. a `range`) or `domain`
+        is given, only those buses of `domain` (or all of its buses) are
+        probed, function by function, and the rest of the index is kept.
+        Devices found that way are not on libpci's own list, which
+        `first_device` walks.
+        """
+        domain, buses = self._rescan_target(buses, domain)
+        with self.lock:
+            if buses is not None:
+                self._free_probed([key for key in self._probed
+                                   if key[0] == domain and key[1] in buses])
+                self._merge_index(domain, buses, list(self._probe_buses(domain, sorted(buses))))
+                return
+            self._free_probed(list(self._probed))
+            raw = self.access.devices
+            while raw:
+                nxt = raw.next
+                self._free(raw)
+                raw = nxt
+            self.access.devices = ffi.NULL
+            lib.pci_scan_bus(self.access)
+            self._build_index(self._index_entries())
+
+    def _own(self, raw):
+        """
+        Register a pci_dev that this object will free, and wrap it.
+        """
+        self._handles[raw] = _Handle()
+        return self._wrap(raw)
+
+    def _wrap(self, raw):
+        return Device(raw, pci=self, handle=self._handles.get(raw))
+
+    def _free(self, raw):
+        handle = self._handles.pop(raw, None)
+        if handle is not None:
+            handle.alive = False
+        lib.pci_free_dev(raw)
+
+    def _probe_buses(self, domain, buses):
+        for key, vendor_id, device_id, device_class, dev in super()._probe_buses(domain, buses):
+            dev = self._probed[key] = self._own(dev.raw_dev)
+            yield key, vendor_id, device_id, device_class, dev
+
+    def _release(self, dev):
+        self._free(dev.raw_dev)
+
+    def _free_probed(self, keys):
+        for key in list(keys):
+            self._release(self._probed.pop(key))
+
+    def _index_entries(self):
+        raw = self.access.devices
+        while raw:
+            lib.pci_fill_info(raw, lib.PCI_FILL_IDENT | lib.PCI_FILL_CLASS)
+            yield ((raw.domain, raw.bus, raw.dev, raw.func), raw.vendor_id,
+                   raw.device_id, raw.device_class, self._own(raw))
+            raw = raw.next
 
     @property
     def first_device(self):
-        return Device(self.access.devices)
+        if self._entries is None:
+            self.rescan_bus()
+        if not self.access.devices:
+            return None
+        return self._wrap(self.access.devices)
 
     @property
     def devices(self):
         return self.first_device
 
-    def search_for_device(self, bus, device, function):
+    def _lookup(self, flags, ids):
+        buf = ffi.new("char[]", self.NAME_BUFFER_SIZE)
+        args = [ffi.cast("int", i) for i in ids]
+        with self.lock:
+            res = lib.pci_lookup_name(self.access, buf, self.NAME_BUFFER_SIZE, flags, *args)
+            if res == ffi.NULL:
+                return None
+            return ffi.string(res).decode("utf-8", "replace")
+
+    def lookup_name(self, flags, *ids):
         """
-        This function may return None if the system does not find a device at
-        the specified address.
+        Resolve IDs to a name with `pci_lookup_name`; `flags` and the meaning
+        of `ids` follow the `PCI_LOOKUP_*` constants.  Results are memoised
+        per PCI object.
         """
-        current = self.first_device
-        while current:
-            if current.bus == bus and \
-               current.dev == device and \
-               current.func == function:
-                return current
-            current = current.next
-        return None
+        return self._cached_lookup(flags, ids)
+
+    def vendor_name(self, vendor_id):
+        return self.lookup_name(lib.PCI_LOOKUP_VENDOR, vendor_id)
+
+    def device_name(self, vendor_id, device_id):
+        return self.lookup_name(lib.PCI_LOOKUP_DEVICE, vendor_id, device_id)
+
+    def class_name(self, device_class):
+        return self.lookup_name(lib.PCI_LOOKUP_CLASS, device_class)
 
     def get_device(self, domain, bus, device, function):
         """
         This function will always return a device object, even if the system
         doesn't think that there is a device at the corresponding address.
         """
-        raw = lib.pci_get_dev(self.access, domain, bus, device, function)
+        with self.lock:
+            raw = lib.pci_get_dev(self.access, domain, bus, device, function)
         if not raw:
             return None
-        return Device(raw)
+        return Device(raw, pci=self)
 
 class Capability:
     def __init__(self, raw_cap):
@@ -82,14 +236,50 @@ class Capability:
     def addr(self):
         return self.raw_cap.addr
 
-class Device:
-    def __init__(self, raw_dev, caching=False):
+class Device(BaseDevice):
+    SNAPSHOT_FLAGS = (lib.PCI_FILL_IDENT | lib.PCI_FILL_CLASS | lib.PCI_FILL_IRQ |
+                      lib.PCI_FILL_BASES | lib.PCI_FILL_ROM_BASE | lib.PCI_FILL_SIZES |
+                      lib.PCI_FILL_PHYS_SLOT | lib.PCI_FILL_MODULE_ALIAS |
+                      lib.PCI_FILL_LABEL | lib.PCI_FILL_NUMA_NODE | lib.PCI_FILL_IO_FLAGS)
+
+    def __init__(self, raw_dev, caching=False, pci=None, handle=None):
+        super().__init__()
         self.raw_dev = raw_dev
         self.caching = caching
+        self.pci = pci
+        self._handle = handle
+        self.domain = raw_dev.domain
+        self.bus = raw_dev.bus
+        self.dev = raw_dev.dev
+        self.func = raw_dev.func
+
+    @contextlib.contextmanager
+    def _using(self):
+        """
+        Hold the access lock while the pci_dev is used, and refuse to use
+        it once a rescan has freed it.
+        """
+        with _NO_LOCK if self.pci is None else self.pci.lock:
+            if self._handle is not None and not self._handle.alive:
+                raise ValueError("%04x:%02x:%02x.%d was freed by a rescan"
+                                 % (self.domain, self.bus, self.dev, self.func))
+            yield
 
     def _fill(self, flags):
         flags |= 0 if self.caching else lib.PCI_FILL_RESCAN
-        return lib.pci_fill_info(self.raw_dev, flags)
+        with self._using():
+            return lib.pci_fill_info(self.raw_dev, flags)
+
+    def _filled(self, flags, get):
+        """
+        Fill `flags` and return `get(raw_dev)`, or None if libpci could not
+        fill them.  The lock is held throughout because a rescanning fill
+        from another thread frees the strings and capability list.
+        """
+        with self._using():
+            if not self._fill(flags):
+                return None
+            return get(self.raw_dev)
 
     @staticmethod
     def _safe_string(thing):
@@ -98,262 +288,181 @@ class Device:
         return ffi.string(thing)
 
     def clear_cache(self):
-        lib.pci_fill_info(self.raw_dev, lib.PCI_FILL_RESCAN)
+        with self._using():
+            lib.pci_fill_info(self.raw_dev, lib.PCI_FILL_RESCAN)
+        self._cap_index = None
 
     @property
     def next(self):
-        raw = self.raw_dev.next
+        with self._using():
+            raw = self.raw_dev.next
         if not raw:
             return None
-        return Device(raw)
-
-    @property
-    def bus(self):
-        return self.raw_dev.bus
-
-    @property
-    def dev(self):
-        return self.raw_dev.dev
-
-    @property
-    def func(self):
-        return self.raw_dev.func
+        return Device(raw) if self.pci is None else self.pci._wrap(raw)
 
     @property
     def vendor_id(self):
-        if not self._fill(lib.PCI_FILL_IDENT):
-            return None
-        return self.raw_dev.vendor_id
+        return self._filled(lib.PCI_FILL_IDENT, lambda raw: raw.vendor_id)
 
     @property
     def device_id(self):
-        if not self._fill(lib.PCI_FILL_IDENT):
-            return None
-        return self.raw_dev.device_id
+        return self._filled(lib.PCI_FILL_IDENT, lambda raw: raw.device_id)
 
     @property
     def device_class(self):
-        if not self._fill(lib.PCI_FILL_CLASS):
-            return None
-        return self.raw_dev.device_class
+        return self._filled(lib.PCI_FILL_CLASS, lambda raw: raw.device_class)
 
     @property
     def irq(self):
-        if not self._fill(lib.PCI_FILL_IRQ):
-            return None
-        return self.raw_dev.irq
+        return self._filled(lib.PCI_FILL_IRQ, lambda raw: raw.irq)
 
     @property
     def base_addr(self):
-        if not self._fill(lib.PCI_FILL_BASES):
-            return None
-        return self.raw_dev.base_addr
+        return self._filled(lib.PCI_FILL_BASES, lambda raw: raw.base_addr)
 
     @property
     def sizes(self):
-        if not self._fill(lib.PCI_FILL_SIZES):
-            return None
-        return self.raw_dev.size
+        return self._filled(lib.PCI_FILL_SIZES, lambda raw: raw.size)
 
     @property
     def rom_base_addr(self):
-        if not self._fill(lib.PCI_FILL_ROM_BASE):
-            return None
-        return self.raw_dev.rom_base_addr
+        return self._filled(lib.PCI_FILL_ROM_BASE, lambda raw: raw.rom_base_addr)
 
     @property
     def rom_size(self):
-        res = self._fill(lib.PCI_FILL_ROM_BASE | lib.PCI_FILL_SIZES)
-        if res & lib.PCI_FILL_ROM_BASE == 0 or res & lib.PCI_FILL_SIZES == 0:
-            return None
-        return self.raw_dev.rom_size
+        with self._using():
+            res = self._fill(lib.PCI_FILL_ROM_BASE | lib.PCI_FILL_SIZES)
+            if res & lib.PCI_FILL_ROM_BASE == 0 or res & lib.PCI_FILL_SIZES == 0:
+                return None
+            return self.raw_dev.rom_size
 
     @property
     def first_cap(self):
-        if not self._fill(lib.PCI_FILL_CAPS):
-            return None
-        raw = self.raw_dev.first_cap
+        with self._using():
+            if not self._fill(lib.PCI_FILL_CAPS):
+                return None
+            raw = self.raw_dev.first_cap
         if not raw:
             return None
         return Capability(raw)
 
     @property
     def phy_slot(self):
-        if not self._fill(lib.PCI_FILL_PHYS_SLOT):
-            return None
-        return self._safe_string(self.raw_dev.phy_slot)
+        return self._filled(lib.PCI_FILL_PHYS_SLOT, lambda raw: self._safe_string(raw.phy_slot))
 
     @property
     def module_alias(self):
-        if not self._fill(lib.PCI_FILL_MODULE_ALIAS):
-            return None
-        return self._safe_string(self.raw_dev.module_alias)
+        return self._filled(lib.PCI_FILL_MODULE_ALIAS,
+                            lambda raw: self._safe_string(raw.module_alias))
 
     @property
     def label(self):
-        if not self._fill(lib.PCI_FILL_LABEL):
-            return None
-        return self._safe_string(self.raw_dev.label)
+        return self._filled(lib.PCI_FILL_LABEL, lambda raw: self._safe_string(raw.label))
 
     @property
     def numa_node(self):
-        if not self._fill(lib.PCI_FILL_NUMA_NODE):
-            return None
-        return self.raw_dev.numa_node
+        return self._filled(lib.PCI_FILL_NUMA_NODE, lambda raw: raw.numa_node)
 
     @property
     def flags(self):
-        if not self._fill(lib.PCI_FILL_IO_FLAGS):
-            return None
-        return self.raw_dev.flags
+        return self._filled(lib.PCI_FILL_IO_FLAGS, lambda raw: raw.flags)
 
     @property
     def rom_flags(self):
-        if not self._fill(lib.PCI_FILL_IO_FLAGS):
-            return None
-        return self.raw_dev.rom_flags
+        return self._filled(lib.PCI_FILL_IO_FLAGS, lambda raw: raw.rom_flags)
 
-    @property
-    def domain(self):
-        return domain
+    def snapshot(self):
+        """
+        Fill all device information with a single `pci_fill_info` call and
+        return it as a `DeviceInfo`.
+        """
+        with self._using():
+            return self._snapshot()
+
+    def _snapshot(self):
+        known = self._fill(self.SNAPSHOT_FLAGS)
+        raw = self.raw_dev
+        def pick(flag, get):
+            return get() if known & flag else None
+        return DeviceInfo(
+            domain=raw.domain, bus=raw.bus, dev=raw.dev, func=raw.func,
+            vendor_id=pick(lib.PCI_FILL_IDENT, lambda: raw.vendor_id),
+            device_id=pick(lib.PCI_FILL_IDENT, lambda: raw.device_id),
+            device_class=pick(lib.PCI_FILL_CLASS, lambda: raw.device_class),
+            irq=pick(lib.PCI_FILL_IRQ, lambda: raw.irq),
+            base_addr=pick(lib.PCI_FILL_BASES, lambda: tuple(raw.base_addr)),
+            sizes=pick(lib.PCI_FILL_SIZES, lambda: tuple(raw.size)),
+            rom_base_addr=pick(lib.PCI_FILL_ROM_BASE, lambda: raw.rom_base_addr),
+            rom_size=pick(lib.PCI_FILL_ROM_BASE, lambda: pick(lib.PCI_FILL_SIZES,
+                                                              lambda: raw.rom_size)),
+            phy_slot=pick(lib.PCI_FILL_PHYS_SLOT, lambda: self._safe_string(raw.phy_slot)),
+            module_alias=pick(lib.PCI_FILL_MODULE_ALIAS,
+                              lambda: self._safe_string(raw.module_alias)),
+            label=pick(lib.PCI_FILL_LABEL, lambda: self._safe_string(raw.label)),
+            numa_node=pick(lib.PCI_FILL_NUMA_NODE, lambda: raw.numa_node),
+            flags=pick(lib.PCI_FILL_IO_FLAGS, lambda: tuple(raw.flags)),
+            rom_flags=pick(lib.PCI_FILL_IO_FLAGS, lambda: raw.rom_flags))
 
     def find_capability(self, cap_id, cap_type):
-        current = self.first_cap
-        while current:
-            if current.id == cap_id and current.type == cap_type:
-                return current
-            current = current.next
-        return None
-
-    def read_byte(self, pos):
-        return lib.pci_read_byte(self.raw_dev, pos)
-
-    def read_word(self, pos):
-        return lib.pci_read_word(self.raw_dev, pos)
-
-    def read_long(self, pos):
-        return lib.pci_read_long(self.raw_dev, pos)
-
-    def read_block(self, pos, length):
-        backing = ffi.new("char[]", length)
-        res = lib.pci_read_block(self.raw_dev, pos, backing, length)
-        if res <= 0:
+        with self._using():
+            current = self.first_cap
+            while current:
+                if current.id == cap_id and current.type == cap_type:
+                    return current
+                current = current.next
             return None
-        return ffi.unpack(backing, length)
 
-    def write_byte(self, pos, byte):
-        return lib.pci_write_byte(self.raw_dev, pos, byte) > 0
+    def _hw_read_byte(self, pos):
+        with self._using():
+            return lib.pci_read_byte(self.raw_dev, pos)
 
-    def write_word(self, pos, word):
-        return lib.pci_write_word(self.raw_dev, pos, word) > 0
+    def _hw_read_word(self, pos):
+        with self._using():
+            return lib.pci_read_word(self.raw_dev, pos)
 
-    def write_long(self, pos, long):
-        return lib.pci_write_long(self.raw_dev, pos, long) > 0
+    def _hw_read_long(self, pos):
+        with self._using():
+            return lib.pci_read_long(self.raw_dev, pos)
 
-    def write_block(self, pos, data):
-        data = bytes(data)
-        return lib.pci_write_block(self.raw_dev, pos, data, len(data)) > 0
+    def _hw_read_into(self, pos, view):
+        with self._using():
+            buf = ffi.from_buffer("u8[]", view, require_writable=True)
+            return lib.pci_read_block(self.raw_dev, pos, buf, len(view)) > 0
+
+    def read_block(self, pos, length):
+        if self._buffered(pos, length) or self.pci is None:
+            return super().read_block(pos, length)
+        with self._using():
+            backing = self.pci.scratch.acquire(length)
+            try:
+                if lib.pci_read_block(self.raw_dev, pos, backing, length) <= 0:
+                    return None
+                return ffi.buffer(backing, length)[:]
+            finally:
+                self.pci.scratch.release(backing)
+
+    def _hw_write_byte(self, pos, byte):
+        with self._using():
+            return lib.pci_write_byte(self.raw_dev, pos, byte) > 0
+
+    def _hw_write_word(self, pos, word):
+        with self._using():
+            return lib.pci_write_word(self.raw_dev, pos, word) > 0
+
+    def _hw_write_long(self, pos, long):
+        with self._using():
+            return lib.pci_write_long(self.raw_dev, pos, long) > 0
+
+    def _hw_write_block(self, pos, view):
+        with self._using():
+            return lib.pci_write_block(self.raw_dev, pos, ffi.from_buffer("u8[]", view),
+                                       len(view)) > 0
 
 
 def main():
-    def parse_address(addr):
-        pat = r"([0-9a-fA-F]{1,2}):([0-9a-fA-F]{1,2}).([0-9a-fA-F])\+([0-9a-fA-F]{1,4})"
-        res = re.fullmatch(pat, addr)
-        if res is None:
-            raise ValueError("Couldn't parse %r as a PCI address" % (addr,))
-        return tuple(map(lambda x: int(x, 16), res.group(1, 2, 3, 4)))
-
-    def format_addr(bus, device, func, offset):
-        return "%02x:%02x.%01x+%04x" % (bus, device, func, offset)
-
-    def unpack(thing):
-        m = {8: "Q", 4: "I", 2: "H", 1: "B"}
-        if len(thing) not in m:
-            raise ValueError("Can't process block of length %d" % (len(thing),))
-        return struct.unpack("<" + m[len(thing)], thing)[0]
-
-    def pack(thing, length):
-        m = {8: "Q", 4: "I", 2: "H", 1: "B"}
-        if length not in m:
-            raise ValueError("Can't process block of length %d" % (length,))
-        return struct.pack("<" + m[length], thing)
-
-    def read(args):
-        fmt = "%s : %0" + str(args.size * 2) + "x"
-        with PCI(method=constants.PCI_ACCESS_I386_TYPE1) as p:
-            for addr in args.address:
-                dev = p.get_device(0, addr[0], addr[1], addr[2])
-                print(fmt % (format_addr(*addr), unpack(dev.read_block(addr[3], args.size))))
-
-    def write(args):
-        fmtr = "%s : %0" + str(args.size * 2) + "x"
-        fmtw = "%s = %0" + str(args.size * 2) + "x"
-        with PCI(method=constants.PCI_ACCESS_I386_TYPE1) as p:
-            s = format_addr(*args.address)
-            dev = p.get_device(0, args.address[0], args.address[1], args.address[2])
-            print(fmtr % (s, unpack(dev.read_block(args.address[3], args.size))))
-            print(fmtw % (s, args.value))
-            dev.write_block(args.address[3], pack(args.value, args.size))
-            print(fmtr % (s, unpack(dev.read_block(args.address[3], args.size))))
-
-    def rmw(args):
-        f = "%0" + str(args.size * 2) + "x"
-        fmtr = "%s : " + f
-        fmtw = "%s = " + f + " = (" + f + " & " + f + ") | (" + f + " & ~" + f + ")"
-        with PCI(method=constants.PCI_ACCESS_I386_TYPE1) as p:
-            s = format_addr(*args.address)
-            dev = p.get_device(0, args.address[0], args.address[1], args.address[2])
-            prev = unpack(dev.read_block(args.address[3], args.size))
-            print(fmtr % (s, prev))
-            new_val = (prev & args.mask) | (args.update & ~args.mask)
-            print(fmtw % (s, new_val, prev, args.mask, args.update, args.mask))
-            dev.write_block(args.address[3], pack(new_val, args.size))
-            print(fmtr % (s, unpack(dev.read_block(args.address[3], args.size))))
-
-    parser = argparse.ArgumentParser(description="Read and write to PCI devices")
-    subp = parser.add_subparsers()
-
-    reader = subp.add_parser("read", help="Read from PCI spaces")
-    reader.set_defaults(func=read)
-    reader.add_argument("address", type=parse_address, nargs="+",
-                        help="The address(es) from which to read, in format bb:dd:f+offset")
-
-    writer = subp.add_parser("write", help="Write to physical memory")
-    writer.set_defaults(func=write)
-    writer.add_argument("address", type=parse_address,
-                        help="The address to which the write should occur, " + \
-                             "in format bb:dd:f+offset")
-    writer.add_argument("value", type=lambda x: int(x, 16),
-                        help="The value to write")
-
-    rmwp = subp.add_parser("rmw", help="Perform a read-modify-write operation to a PCI device")
-    rmwp.set_defaults(func=rmw)
-    rmwp.add_argument("address", type=parse_address,
-                     help="The address that should be read and modified, in format bb:dd:f+offset")
-    rmwp.add_argument("mask", type=lambda x: int(x, 16),
-                     help="The mask for the bits that should be preserved")
-    rmwp.add_argument("update", type=lambda x: int(x, 16),
-                     help="The new value that should be ORed into the read value")
-    def add_sizes(p):
-        meg = p.add_mutually_exclusive_group()
-        meg.add_argument("--byte", dest="size", action="store_const", const=1,
-                         help="Operate on bytes")
-        meg.add_argument("--word", dest="size", action="store_const", const=2,
-                         help="Operate on words (2 bytes)")
-        meg.add_argument("--long", dest="size", action="store_const", const=4,
-                         help="Operate on longs (4 bytes)")
-        meg.add_argument("--qword", dest="size", action="store_const", const=8,
-                         help="Operate on qwords (8 bytes)")
-        p.set_defaults(size=4)
-
-    add_sizes(reader)
-    add_sizes(writer)
-    add_sizes(rmwp)
-
-    args = parser.parse_args()
-    if "func" not in args:
-        parser.error("must specify a mode")
-    args.func(args)
+    # pcitool lives in chipset.pci.tool so it can start without libpci.
+    from .tool import main
+    main()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,57 @@
+"""
+PCI configuration space register offsets, bit masks and capability IDs.
+
+Names and values follow Linux's `pci_regs.h`, and so the constants libpci
+exports through `chipset.pci.constants`.
+"""
+
+# Standard header, common to all header types.
+PCI_VENDOR_ID = 0x00
+PCI_DEVICE_ID = 0x02
+PCI_COMMAND = 0x04
+PCI_STATUS = 0x06
+PCI_STATUS_CAP_LIST = 0x10
+PCI_CLASS_DEVICE = 0x0a
+PCI_HEADER_TYPE = 0x0e
+PCI_HEADER_TYPE_MASK = 0x7f
+PCI_HEADER_TYPE_MULTIFUNCTION = 0x80
+PCI_HEADER_TYPE_NORMAL = 0
+PCI_HEADER_TYPE_BRIDGE = 1
+PCI_HEADER_TYPE_CARDBUS = 2
+
+# Type 0 and type 1 headers.
+PCI_BASE_ADDRESS_0 = 0x10
+PCI_BASE_ADDRESS_SPACE_IO = 0x01
+PCI_BASE_ADDRESS_MEM_MASK = ~0x0f
+PCI_NUM_BARS = 6
+PCI_PRIMARY_BUS = 0x18
+PCI_CAPABILITY_LIST = 0x34
+PCI_CB_CAPABILITY_LIST = 0x14
+
+# Capability types, as used by libpci.
+PCI_CAP_NORMAL = 1
+PCI_CAP_EXTENDED = 2
+
+PCI_CAP_ID_PM = 0x01
+PCI_CAP_ID_MSI = 0x05
+PCI_CAP_ID_EXP = 0x10
+PCI_CAP_ID_MSIX = 0x11
+PCI_EXT_CAP_ID_ERR = 0x01
+PCI_EXT_CAP_ID_SRIOV = 0x10
+
+PCI_MSI_FLAGS_64BIT = 0x80
+PCI_MSI_FLAGS_MASKBIT = 0x100
+PCI_MSIX_TABSIZE = 0x07ff
+
+# PCI Express capability.
+PCI_EXP_FLAGS = 0x02
+PCI_EXP_FLAGS_TYPE = 0x00f0
+PCI_EXP_TYPE_ROOT_PORT = 0x4
+PCI_EXP_TYPE_UPSTREAM = 0x5
+PCI_EXP_TYPE_DOWNSTREAM = 0x6
+PCI_EXP_TYPE_RC_EC = 0xa
+
+# Advanced Error Reporting extended capability.
+PCI_ERR_UNCOR_STATUS = 0x04
+PCI_ERR_COR_STATUS = 0x10
+PCI_ERR_ROOT_COMMAND = 0x2c
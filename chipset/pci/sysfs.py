@@ -0,0 +1,300 @@
+"""
+PCI access through Linux sysfs, without libpci or the cffi extension.
+
+Configuration space goes through `os.preadv`/`os.pwrite` on a config file
+descriptor that is opened on a device's first access and kept open.  At
+most `max_open` descriptors are kept, closing the least recently used one
+when another is needed, so hosts with thousands of (SR-IOV) functions stay
+within the open file limit.  Enumeration reads each header through a
+short-lived descriptor.  The root directory is configurable so a fake
+sysfs tree can stand in for the real one.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from .base import BaseAccess, BaseDevice, SYSFS_ROOT
+
+
+PCI_ADDR_FLAG_MASK = 0xf
+NUM_RESOURCES = 6
+ROM_RESOURCE = 6
+HEADER_SIZE = 12
+DEFAULT_MAX_OPEN = 256
+
+_NAME = re.compile(r"([0-9a-fA-F]+):([0-9a-fA-F]{2}):([0-9a-fA-F]{2})\.([0-7])")
+
+class SysfsPCI(BaseAccess):
+    parallel = True
+
+    def __init__(self, root=SYSFS_ROOT, writeable=True, scan=True, max_open=DEFAULT_MAX_OPEN):
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.root = root
+        self.writeable = writeable
+        self.max_open = max_open
+        self._known = {}
+        # Devices with an open config fd, least recently used first.
+        self._open = OrderedDict()
+        self._fd_lock = threading.Lock()
+        if scan:
+            self.rescan_bus()
+
+    def close(self):
+        self._close_devices(list(self._known))
+        # Devices dropped by a rescan may have been used again since.
+        with self._fd_lock:
+            for dev in self._open:
+                dev._close_fd()
+            self._open.clear()
+
+    def _close_devices(self, keys):
+        with self._fd_lock:
+            for key in keys:
+                dev = self._known.pop(key)
+                if self._open.pop(dev, None) is not None:
+                    dev._close_fd()
+
+    def _checkout(self, dev):
+        """
+        Return `dev`'s config fd, opening it if needed, and mark it busy
+        until `_checkin` so that it isn't closed while in use.
+        """
+        with self._fd_lock:
+            if dev._fd is None:
+                self._evict()
+                dev._fd = dev._open_config()
+                self._open[dev] = dev
+            else:
+                self._open.move_to_end(dev)
+            dev._busy += 1
+            return dev._fd
+
+    def _checkin(self, dev):
+        with self._fd_lock:
+            dev._busy -= 1
+
+    def _evict(self):
+        while len(self._open) >= self.max_open:
+            idle = next((dev for dev in self._open if not dev._busy), None)
+            if idle is None:
+                # Every fd is in use; go over the limit rather than wait.
+                return
+            del self._open[idle]
+            idle._close_fd()
+
+    def _read_header(self, key):
+        try:
+            fd = os.open(os.path.join(self.root, SysfsDevice.name_for(*key), "config"),
+                         os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            header = os.pread(fd, HEADER_SIZE, 0)
+        except OSError:
+            return None
+        finally:
+            os.close(fd)
+        return header if len(header) == HEADER_SIZE else None
+
+    def rescan_bus(self, buses=None, domain=None):
+        """
+        Relist the devices, or only those of `domain` or on the given buses.
+        """
+        domain, buses = self._rescan_target(buses, domain)
+        if buses is None:
+            self.close()
+            self._build_index(self._index_entries())
+            return
+        self._close_devices([key for key in self._known
+                             if key[0] == domain and key[1] in buses])
+        self._merge_index(domain, buses, self._index_entries(
+            lambda key: key[0] == domain and key[1] in buses))
+
+    def _index_entries(self, select=None):
+        for name in sorted(os.listdir(self.root)):
+            match = _NAME.fullmatch(name)
+            if match is None:
+                continue
+            key = tuple(int(g, 16) for g in match.groups())
+            if select is not None and not select(key):
+                continue
+            header = self._read_header(key)
+            if header is None:
+                continue
+            yield (key, header[0] | header[1] << 8, header[2] | header[3] << 8,
+                   header[10] | header[11] << 8, self._device(key))
+
+    def _device(self, key):
+        dev = self._known.get(key)
+        if dev is None:
+            dev = self._known[key] = SysfsDevice(self, *key)
+        return dev
+
+    def get_device(self, domain, bus, device, function):
+        """
+        Unlike libpci, sysfs can only reach devices the kernel knows about,
+        so this returns None if there is no such device.
+        """
+        key = (domain, bus, device, function)
+        if not os.path.isdir(os.path.join(self.root, SysfsDevice.name_for(*key))):
+            return None
+        return self._device(key)
+
+class SysfsDevice(BaseDevice):
+    def __init__(self, access, domain, bus, dev, func):
+        super().__init__(access)
+        self.domain = domain
+        self.bus = bus
+        self.dev = dev
+        self.func = func
+        self.path = os.path.join(access.root, self.name_for(domain, bus, dev, func))
+        self._fd = None
+        self._busy = 0
+
+    @staticmethod
+    def name_for(domain, bus, dev, func):
+        return "%04x:%02x:%02x.%d" % (domain, bus, dev, func)
+
+    def _close_fd(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _open_config(self):
+        path = os.path.join(self.path, "config")
+        if self.access.writeable:
+            try:
+                return os.open(path, os.O_RDWR)
+            except PermissionError:
+                pass
+        return os.open(path, os.O_RDONLY)
+
+    def _with_fd(self, op, *args):
+        fd = self.access._checkout(self)
+        try:
+            return op(fd, *args)
+        finally:
+            self.access._checkin(self)
+
+    def _attribute(self, name):
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _int_attribute(self, name, base=0):
+        value = self._attribute(name)
+        return None if value is None else int(value, base)
+
+    @property
+    def vendor_id(self):
+        return self._int_attribute("vendor")
+
+    @property
+    def device_id(self):
+        return self._int_attribute("device")
+
+    @property
+    def device_class(self):
+        value = self._int_attribute("class")
+        return None if value is None else value >> 8
+
+    @property
+    def irq(self):
+        return self._int_attribute("irq")
+
+    @property
+    def numa_node(self):
+        return self._int_attribute("numa_node")
+
+    # Strings are bytes, as libpci returns them.
+
+    @property
+    def module_alias(self):
+        value = self._attribute("modalias")
+        return None if value is None else value.encode()
+
+    @property
+    def label(self):
+        value = self._attribute("label")
+        return None if value is None else value.encode()
+
+    def _resources(self):
+        value = self._attribute("resource")
+        if value is None:
+            return None
+        res = []
+        for line in value.splitlines():
+            start, end, flags = (int(x, 16) for x in line.split())
+            size = end - start + 1 if end else 0
+            res.append((start | (flags & PCI_ADDR_FLAG_MASK) if start else 0, size, flags))
+        return res
+
+    @property
+    def base_addr(self):
+        res = self._resources()
+        return None if res is None else [r[0] for r in res[:NUM_RESOURCES]]
+
+    @property
+    def sizes(self):
+        res = self._resources()
+        return None if res is None else [r[1] for r in res[:NUM_RESOURCES]]
+
+    @property
+    def flags(self):
+        res = self._resources()
+        return None if res is None else [r[2] for r in res[:NUM_RESOURCES]]
+
+    @property
+    def rom_base_addr(self):
+        res = self._resources()
+        return None if res is None or len(res) <= ROM_RESOURCE else res[ROM_RESOURCE][0]
+
+    @property
+    def rom_size(self):
+        res = self._resources()
+        return None if res is None or len(res) <= ROM_RESOURCE else res[ROM_RESOURCE][1]
+
+    @property
+    def rom_flags(self):
+        res = self._resources()
+        return None if res is None or len(res) <= ROM_RESOURCE else res[ROM_RESOURCE][2]
+
+    def map_bar(self, index, writeable=True, sysfs_root=None):
+        return super().map_bar(index, writeable=writeable,
+                               sysfs_root=self.access.root if sysfs_root is None else sysfs_root)
+
+    def _hw_read_byte(self, pos):
+        return self._hw_read_int(pos, 1)
+
+    def _hw_read_word(self, pos):
+        return self._hw_read_int(pos, 2)
+
+    def _hw_read_long(self, pos):
+        return self._hw_read_int(pos, 4)
+
+    def _hw_read_int(self, pos, size):
+        raw = self._with_fd(os.pread, size, pos)
+        if len(raw) != size:
+            return (1 << (size * 8)) - 1
+        return int.from_bytes(raw, "little")
+
+    def _hw_read_into(self, pos, view):
+        return self._with_fd(os.preadv, [view], pos) == len(view)
+
+    def _hw_write_byte(self, pos, byte):
+        return self._hw_write_block(pos, byte.to_bytes(1, "little"))
+
+    def _hw_write_word(self, pos, word):
+        return self._hw_write_block(pos, word.to_bytes(2, "little"))
+
+    def _hw_write_long(self, pos, long):
+        return self._hw_write_block(pos, long.to_bytes(4, "little"))
+
+    def _hw_write_block(self, pos, view):
+        try:
+            return self._with_fd(os.pwrite, view, pos) == len(view)
+        except OSError:
+            return False
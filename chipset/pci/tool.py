@@ -0,0 +1,286 @@
+import re
+import sys
+import struct
+import argparse
+
+
+def main():
+    def open_access(args):
+        # Nothing is enumerated until a command iterates the devices.
+        if args.ecam:
+            from .ecam import ECAM
+            if args.ecam_base is not None:
+                return ECAM(base=args.ecam_base, scan=False)
+            return ECAM(segment=None, scan=False)
+        if args.sysfs:
+            from .sysfs import SysfsPCI
+            return SysfsPCI(scan=False)
+        from .pci import PCI, constants
+        return PCI(method=constants.PCI_ACCESS_I386_TYPE1, scan=False)
+
+    def parse_address(addr):
+        """
+        Parse `[dddd:]bb:dd.f+offset` into `(domain, bus, dev, func, offset)`.
+        The domain may be longer than four digits, as on VMD-attached buses.
+        """
+        pat = r"(?:([0-9a-fA-F]+):)?([0-9a-fA-F]{1,2}):([0-9a-fA-F]{1,2}).([0-9a-fA-F])" + \
+              r"\+([0-9a-fA-F]{1,4})"
+        res = re.fullmatch(pat, addr)
+        if res is None:
+            raise ValueError("Couldn't parse %r as a PCI address" % (addr,))
+        return tuple(map(lambda x: int(x or "0", 16), res.group(1, 2, 3, 4, 5)))
+
+    def parse_read_address(addr):
+        """
+        Like `parse_address`, but also accepts `[dddd:]bb:dd.f+offset-length`
+        ranges.  Returns `(domain, bus, dev, func, offset, length)`; `length`
+        is None for single addresses.
+        """
+        base, sep, length = addr.partition("-")
+        return parse_address(base) + ((int(length, 16) if sep else None),)
+
+    def read_addresses(args):
+        """
+        Return `(domain, bus, dev, func, offset, width)` reads.  Ranges are
+        split into `args.size` reads, with narrower ones for a tail that is
+        shorter than that.
+        """
+        parsed = list(args.address)
+        for f in args.file or ():
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    parsed.append(parse_read_address(line))
+        addrs = []
+        for domain, bus, dev, func, offset, length in parsed:
+            if length is None:
+                addrs.append((domain, bus, dev, func, offset, args.size))
+                continue
+            off, end = offset, offset + length
+            while off < end:
+                width = max(w for w in (8, 4, 2, 1) if w <= min(args.size, end - off))
+                addrs.append((domain, bus, dev, func, off, width))
+                off += width
+        return addrs
+
+    def covering_blocks(accesses):
+        """
+        Merge `(offset, width)` accesses into the minimal list of
+        `(start, length)` block reads that cover them.
+        """
+        blocks = []
+        for off, size in sorted(set(accesses)):
+            if blocks and off <= blocks[-1][0] + blocks[-1][1]:
+                start, length = blocks[-1]
+                blocks[-1] = (start, max(length, off + size - start))
+            else:
+                blocks.append((off, size))
+        return blocks
+
+    def format_device(domain, bus, device, func):
+        # Like lspci, only show the domain if it isn't 0.
+        res = "%02x:%02x.%01x" % (bus, device, func)
+        return "%04x:%s" % (domain, res) if domain else res
+
+    def format_addr(domain, bus, device, func, offset):
+        return "%s+%04x" % (format_device(domain, bus, device, func), offset)
+
+    def open_device(p, address):
+        dev = p.get_device(*address[:4])
+        if dev is None:
+            sys.exit("No device at %s" % (format_device(*address[:4]),))
+        return dev
+
+    def unpack(thing):
+        m = {8: "Q", 4: "I", 2: "H", 1: "B"}
+        if len(thing) not in m:
+            raise ValueError("Can't process block of length %d" % (len(thing),))
+        return struct.unpack("<" + m[len(thing)], thing)[0]
+
+    def pack(thing, length):
+        m = {8: "Q", 4: "I", 2: "H", 1: "B"}
+        if length not in m:
+            raise ValueError("Can't process block of length %d" % (length,))
+        return struct.pack("<" + m[length], thing)
+
+    def read(args):
+        addrs = read_addresses(args)
+        if not addrs:
+            sys.exit("No addresses to read")
+        by_device = {}
+        for addr in addrs:
+            by_device.setdefault(addr[:4], []).append(addr[4:])
+        values = {}
+        with open_access(args) as p:
+            for dbdf, accesses in by_device.items():
+                dev = open_device(p, dbdf)
+                for start, length in covering_blocks(accesses):
+                    block = dev.read_block(start, length)
+                    if block is None:
+                        sys.exit("Couldn't read %d bytes at %s"
+                                 % (length, format_addr(*dbdf + (start,))))
+                    for off, width in accesses:
+                        if start <= off < start + length:
+                            rel = off - start
+                            values[dbdf + (off, width)] = unpack(block[rel:rel + width])
+        for addr in addrs:
+            print("%s : %0*x" % (format_addr(*addr[:5]), addr[5] * 2, values[addr]))
+
+    def write(args):
+        fmtr = "%s : %0" + str(args.size * 2) + "x"
+        fmtw = "%s = %0" + str(args.size * 2) + "x"
+        with open_access(args) as p:
+            s = format_addr(*args.address)
+            dev = open_device(p, args.address)
+            print(fmtr % (s, unpack(dev.read_block(args.address[4], args.size))))
+            print(fmtw % (s, args.value))
+            dev.write_block(args.address[4], pack(args.value, args.size))
+            print(fmtr % (s, unpack(dev.read_block(args.address[4], args.size))))
+
+    def rmw(args):
+        f = "%0" + str(args.size * 2) + "x"
+        fmtr = "%s : " + f
+        fmtw = "%s = " + f + " = (" + f + " & " + f + ") | (" + f + " & ~" + f + ")"
+        with open_access(args) as p:
+            s = format_addr(*args.address)
+            dev = open_device(p, args.address)
+            prev = unpack(dev.read_block(args.address[4], args.size))
+            print(fmtr % (s, prev))
+            new_val = (prev & args.mask) | (args.update & ~args.mask)
+            print(fmtw % (s, new_val, prev, args.mask, args.update, args.mask))
+            dev.write_block(args.address[4], pack(new_val, args.size))
+            print(fmtr % (s, unpack(dev.read_block(args.address[4], args.size))))
+
+    def dump(args):
+        from .archive import dump_devices, write_archive
+        with open_access(args) as p:
+            records = dump_devices(p, size=args.config_size, workers=args.workers)
+        mode = "wb" if args.format == "binary" else "w"
+        if args.outfile == "-":
+            out = sys.stdout.buffer if args.format == "binary" else sys.stdout
+            write_archive(out, records, fmt=args.format)
+        else:
+            with open(args.outfile, mode) as out:
+                write_archive(out, records, fmt=args.format)
+
+    def inventory(args):
+        from .inventory import collect_inventory, write_inventory
+        with open_access(args) as p:
+            inv = collect_inventory(p, host=args.host, config_hashes=args.config_hashes)
+        if args.outfile == "-":
+            write_inventory(sys.stdout.buffer, inv)
+        else:
+            with open(args.outfile, "wb") as out:
+                write_inventory(out, inv)
+
+    def inventory_diff(args):
+        from .inventory import load_inventory, diff_against
+        golden = load_inventory(args.golden)
+        differing = diff_against(golden, (load_inventory(path) for path in args.inventories))
+        for host, changes in sorted(differing.items()):
+            for change in changes:
+                print("%s %s %s %s" % (host, change.kind, change.address,
+                                       ",".join(change.fields)))
+        if differing:
+            sys.exit(1)
+
+    def segments(args):
+        with open_access(args) as p:
+            stats = p.segment_stats()
+        print("segment  devices  buses  range")
+        for domain, st in sorted(stats.items()):
+            print("%04x     %7d  %5d  %02x-%02x" % (domain, st.devices, st.buses,
+                                                 st.first_bus, st.last_bus))
+
+    parser = argparse.ArgumentParser(description="Read and write to PCI devices")
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--ecam", action="store_true",
+                         help="Use memory-mapped (ECAM) config access for every segment " + \
+                              "in the ACPI MCFG table")
+    backend.add_argument("--sysfs", action="store_true",
+                         help="Use /sys/bus/pci instead of libpci")
+    parser.add_argument("--ecam-base", type=lambda x: int(x, 16), metavar="HEX",
+                        help="With --ecam, use the ECAM window at this physical address " + \
+                             "for segment 0 instead of the MCFG table")
+    subp = parser.add_subparsers()
+
+    reader = subp.add_parser("read", help="Read from PCI spaces")
+    reader.set_defaults(func=read)
+    reader.add_argument("address", type=parse_read_address, nargs="*",
+                        help="The address(es) from which to read, in format [dddd:]bb:dd.f+offset, " + \
+                             "or ranges in format [dddd:]bb:dd.f+offset-length")
+    reader.add_argument("-f", "--file", type=argparse.FileType("r"), action="append",
+                        help="Read further addresses or ranges from a file, one per line")
+
+    writer = subp.add_parser("write", help="Write to physical memory")
+    writer.set_defaults(func=write)
+    writer.add_argument("address", type=parse_address,
+                        help="The address to which the write should occur, " + \
+                             "in format [dddd:]bb:dd.f+offset")
+    writer.add_argument("value", type=lambda x: int(x, 16),
+                        help="The value to write")
+
+    rmwp = subp.add_parser("rmw", help="Perform a read-modify-write operation to a PCI device")
+    rmwp.set_defaults(func=rmw)
+    rmwp.add_argument("address", type=parse_address,
+                     help="The address that should be read and modified, " + \
+                          "in format [dddd:]bb:dd.f+offset")
+    rmwp.add_argument("mask", type=lambda x: int(x, 16),
+                     help="The mask for the bits that should be preserved")
+    rmwp.add_argument("update", type=lambda x: int(x, 16),
+                     help="The new value that should be ORed into the read value")
+
+    dumper = subp.add_parser("dump", help="Dump the configuration space of every device")
+    dumper.set_defaults(func=dump)
+    dumper.add_argument("outfile",
+                        help="The archive to write, or - for standard output")
+    dumper.add_argument("--config-size", type=int, choices=(256, 4096), default=4096,
+                        help="Bytes of configuration space to dump per function")
+    dumper.add_argument("--format", choices=("binary", "jsonl"), default="binary",
+                        help="Archive format")
+    dumper.add_argument("--workers", type=int, default=8,
+                        help="Reader threads, for backends that allow parallel access")
+
+    invp = subp.add_parser("inventory", help="Write a compressed hardware inventory")
+    invp.set_defaults(func=inventory)
+    invp.add_argument("outfile",
+                      help="The inventory to write, or - for standard output")
+    invp.add_argument("--host",
+                      help="The host name to record (default: this host's name)")
+    invp.add_argument("--config-hashes", action="store_true",
+                      help="Record a hash of each function's configuration space")
+
+    invdiff = subp.add_parser("inventory-diff",
+                              help="Compare inventories against a golden inventory")
+    invdiff.set_defaults(func=inventory_diff)
+    invdiff.add_argument("golden", help="The reference inventory")
+    invdiff.add_argument("inventories", nargs="+", help="The inventories to check")
+
+    segp = subp.add_parser("segments", help="Show per-segment (PCI domain) device counts")
+    segp.set_defaults(func=segments)
+
+    def add_sizes(p):
+        meg = p.add_mutually_exclusive_group()
+        meg.add_argument("--byte", dest="size", action="store_const", const=1,
+                         help="Operate on bytes")
+        meg.add_argument("--word", dest="size", action="store_const", const=2,
+                         help="Operate on words (2 bytes)")
+        meg.add_argument("--long", dest="size", action="store_const", const=4,
+                         help="Operate on longs (4 bytes)")
+        meg.add_argument("--qword", dest="size", action="store_const", const=8,
+                         help="Operate on qwords (8 bytes)")
+        p.set_defaults(size=4)
+
+    add_sizes(reader)
+    add_sizes(writer)
+    add_sizes(rmwp)
+
+    args = parser.parse_args()
+    if args.ecam_base is not None and not args.ecam:
+        parser.error("--ecam-base needs --ecam")
+    if "func" not in args:
+        parser.error("must specify a mode")
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
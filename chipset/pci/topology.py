@@ -0,0 +1,131 @@
+"""
+The bridge hierarchy of a PCI access backend.
+
+Bridges (header type 1) are linked to the devices behind them through their
+secondary and subordinate bus numbers.  Every bus is mapped to the deepest
+bridge whose range covers it, so parent lookups are a dictionary access and
+path queries cost O(depth).
+"""
+from .regs import (PCI_CAP_ID_EXP, PCI_CAP_NORMAL, PCI_EXP_FLAGS, PCI_EXP_FLAGS_TYPE,
+                   PCI_EXP_TYPE_UPSTREAM, PCI_HEADER_TYPE, PCI_HEADER_TYPE_BRIDGE,
+                   PCI_HEADER_TYPE_MASK, PCI_PRIMARY_BUS)
+
+
+class Topology:
+    def __init__(self, entries):
+        """
+        `entries` yields `((domain, bus, dev, func), device)` pairs.
+        """
+        self._devices = {}
+        self._ranges = {}
+        for key, dev in entries:
+            self._devices[key] = dev
+            if dev.read_byte(PCI_HEADER_TYPE) & PCI_HEADER_TYPE_MASK == PCI_HEADER_TYPE_BRIDGE:
+                buses = dev.read_block(PCI_PRIMARY_BUS, 3)
+                if buses is None:
+                    continue
+                primary, secondary, subordinate = buses
+                if secondary and secondary <= subordinate:
+                    self._ranges[key] = (secondary, subordinate)
+        # Assign buses from the widest range to the narrowest, so that each
+        # bus ends up owned by the deepest bridge above it.
+        self._bus_owner = {}
+        for key, (secondary, subordinate) in sorted(self._ranges.items(),
+                                                    key=lambda kv: kv[1][0] - kv[1][1]):
+            for bus in range(secondary, subordinate + 1):
+                self._bus_owner[(key[0], bus)] = key
+        self._children = {}
+        for key in self._devices:
+            parent = self._bus_owner.get((key[0], key[1]))
+            if parent is not None and parent != key:
+                self._children.setdefault(parent, []).append(key)
+
+    @staticmethod
+    def _key(dev):
+        """
+        Devices are identified by address, so any object for the same
+        function (e.g. a fresh `get_device` result) works.
+        """
+        if isinstance(dev, tuple):
+            return dev
+        return (dev.domain, dev.bus, dev.dev, dev.func)
+
+    def is_bridge(self, dev):
+        return self._key(dev) in self._ranges
+
+    def bus_range(self, bridge):
+        """
+        Return `(secondary, subordinate)` for a bridge, or None.
+        """
+        return self._ranges.get(self._key(bridge))
+
+    def parent(self, dev):
+        """
+        Return the bridge directly above a device, or None for devices on a
+        root bus.
+        """
+        key = self._key(dev)
+        parent = self._bus_owner.get((key[0], key[1]))
+        if parent is None or parent == key:
+            return None
+        return self._devices[parent]
+
+    def children(self, bridge):
+        return [self._devices[key] for key in self._children.get(self._key(bridge), ())]
+
+    def path(self, dev):
+        """
+        Return the bridges from the root down to, and including, `dev`.
+        """
+        res = [self._devices[self._key(dev)]]
+        current = self.parent(dev)
+        while current is not None:
+            res.append(current)
+            current = self.parent(current)
+        res.reverse()
+        return res
+
+    def subtree(self, bridge):
+        """
+        Return every device below a bridge, depth first.
+        """
+        res = []
+        stack = list(reversed(self._children.get(self._key(bridge), ())))
+        while stack:
+            key = stack.pop()
+            res.append(self._devices[key])
+            stack.extend(reversed(self._children.get(key, ())))
+        return res
+
+    def roots(self):
+        return [dev for key, dev in self._devices.items() if self.parent(key) is None]
+
+    @staticmethod
+    def port_type(dev):
+        """
+        Return the PCIe device/port type of a device, or None if it has no
+        PCI Express capability.
+        """
+        pos = dev.find_capability_offset(PCI_CAP_ID_EXP, PCI_CAP_NORMAL)
+        if pos is None:
+            return None
+        return (dev.read_word(pos + PCI_EXP_FLAGS) & PCI_EXP_FLAGS_TYPE) >> 4
+
+    def upstream_switch(self, dev):
+        """
+        Return the upstream port of the nearest switch above a device (for a
+        VF, the switch above its PF's bus), or None if it isn't behind one.
+        """
+        current = self.parent(dev)
+        while current is not None:
+            if self.port_type(current) == PCI_EXP_TYPE_UPSTREAM:
+                return current
+            current = self.parent(current)
+        return None
+
+    def root_port(self, dev):
+        """
+        Return the topmost bridge above a device, normally its root port.
+        """
+        path = self.path(dev)
+        return path[0] if len(path) > 1 else None
@@ -0,0 +1,109 @@
+"""
+Hotplug monitoring: periodically rescan an access backend and report
+devices that appear, disappear or change identity.
+
+Before each rescan a cheap stamp of the sysfs device directory (its mtime
+and entry names) is compared with the previous one, and the rescan is
+skipped if nothing moved.  Every `full_every` polls a rescan happens
+regardless, to catch changes sysfs doesn't reflect in the directory.
+"""
+import os
+import asyncio
+import threading
+from collections import namedtuple
+from .sysfs import SYSFS_ROOT
+from .events import ADDED, REMOVED, CHANGED
+
+
+# `old` and `new` are (vendor_id, device_id) pairs, None where not present.
+Event = namedtuple("Event", ("kind", "address", "old", "new"))
+
+_ACCESS_ROOT = object()
+
+class DeviceWatcher:
+    def __init__(self, access, interval=1.0, stamp_path=_ACCESS_ROOT, full_every=10):
+        """
+        `stamp_path` defaults to the sysfs directory `access` reads from (its
+        `root`, if it has one); None disables the stamp check.
+        """
+        if stamp_path is _ACCESS_ROOT:
+            stamp_path = getattr(access, "root", SYSFS_ROOT)
+        self.access = access
+        self.interval = interval
+        self.stamp_path = stamp_path
+        self.full_every = full_every
+        self._callbacks = []
+        self._polls = 0
+        self._stamp = self._read_stamp()
+        self._state = access.idents()
+
+    def subscribe(self, callback):
+        """
+        Call `callback(event)` for every event found by `poll`.
+        """
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        self._callbacks.remove(callback)
+
+    def _read_stamp(self):
+        if self.stamp_path is None:
+            return None
+        try:
+            return (os.stat(self.stamp_path).st_mtime_ns,
+                    frozenset(os.listdir(self.stamp_path)))
+        except OSError:
+            return None
+
+    def poll(self, force=False):
+        """
+        Rescan if the stamp moved (or `force`, or a periodic full rescan is
+        due), diff against the previous device set, notify subscribers and
+        return the list of events.
+        """
+        self._polls += 1
+        stamp = self._read_stamp()
+        due = self.full_every and self._polls % self.full_every == 0
+        if not force and not due and stamp is not None and stamp == self._stamp:
+            return []
+        self._stamp = stamp
+        self.access.rescan_bus()
+        state = self.access.idents()
+        events = []
+        for key, ident in state.items():
+            old = self._state.get(key)
+            if old is None:
+                events.append(Event(ADDED, key, None, ident))
+            elif old != ident:
+                events.append(Event(CHANGED, key, old, ident))
+        for key, ident in self._state.items():
+            if key not in state:
+                events.append(Event(REMOVED, key, ident, None))
+        self._state = state
+        for event in events:
+            for callback in list(self._callbacks):
+                callback(event)
+        return events
+
+    def run(self, stop=None):
+        """
+        Poll every `interval` seconds until `stop` (a `threading.Event`) is set.
+        """
+        if stop is None:
+            stop = threading.Event()
+        while not stop.wait(self.interval):
+            self.poll()
+
+    async def events(self):
+        """
+        Asynchronously yield events, polling every `interval` seconds in the
+        default executor.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            for event in await loop.run_in_executor(None, self.poll):
+                yield event
+            await asyncio.sleep(self.interval)
+
+    def __aiter__(self):
+        return self.events()
@@ -1,2 +1,8 @@
 from .pcr import PCR, Register
-from .port_mapper import map_pcr_port
+from .._lazy import lazy_module
+
+
+# port_mapper is only loaded on first access (PEP 562).
+__getattr__, __dir__ = lazy_module(__name__, {
+    "map_pcr_port": ".port_mapper",
+})
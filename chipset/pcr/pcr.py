@@ -1,7 +1,10 @@
 import os
 import mmap
 import struct
-from ..pci import PCI, constants as pci_const
+import array
+import itertools
+from collections import namedtuple
+from ..wait import wait_for, DEFAULT_POLICY
 
 
 NUM_PORTS = 256
@@ -10,6 +13,44 @@ REGISTER_SIZE = 4
 
 PORT_SHIFT = 16
 
+NO_MASKS = (0, 0, 0)
+
+BatchResult = namedtuple("BatchResult", ("written", "mismatches"))
+BatchMismatch = namedtuple("BatchMismatch", ("port", "offset", "expected", "actual"))
+
+def augment_value(val, always_one, always_zero, no_modify, old):
+    """
+    Apply `Register`-style masks to `val`; `old` is only used when
+    `no_modify` is nonzero.
+    """
+    val |=  always_one
+    val &= ~always_zero
+    if no_modify != 0:
+        val &= ~no_modify
+        val |= old & no_modify
+    return val & 0xffffffff
+
+def _batch_entry(entry):
+    """
+    Validate a `write_batch` entry and return `(port, offset, value, masks)`.
+    """
+    if len(entry) not in (3, 4):
+        raise ValueError("batch entries are (port, offset, value[, masks]), not %r" % (entry,))
+    port, offset, value = entry[:3]
+    masks = entry[3] if len(entry) > 3 and entry[3] is not None else NO_MASKS
+    if not 0 <= port < NUM_PORTS:
+        raise ValueError("port %r is out of range" % (port,))
+    if not 0 <= offset < PORT_SIZE or offset % REGISTER_SIZE:
+        raise ValueError("offset %r is not a register offset" % (offset,))
+    if len(masks) != len(NO_MASKS):
+        raise ValueError("masks must be (always_one, always_zero, no_modify), not %r" % (masks,))
+    return port, offset, value, tuple(masks)
+
+def _native():
+    # The cffi extension is only loaded once a native helper is needed.
+    from ..pci._libpci import lib, ffi
+    return lib, ffi
+
 class PCR:
     def __init__(self, base):
         self.base = base
@@ -29,7 +70,8 @@ class PCR:
 
     @staticmethod
     def find_pcr_base():
-        with PCI(method=pci_const.PCI_ACCESS_I386_TYPE1) as pci:
+        from ..pci.pci import PCI, constants as pci_const
+        with PCI(method=pci_const.PCI_ACCESS_I386_TYPE1, scan=False) as pci:
             dev = pci.get_device(0, 0, 31, 1)
             dev.caching = False
             original = dev.read_long(0xe0)
@@ -58,6 +100,106 @@ class PCR:
         raw = struct.pack("<I", value)
         self.backing[addr:addr + REGISTER_SIZE] = raw
 
+    def _check_span(self, port, offset, count):
+        if offset % REGISTER_SIZE or offset + count * REGISTER_SIZE > PORT_SIZE:
+            raise ValueError("%d registers at +%x do not fit in a port" % (count, offset))
+        return self._translate_address(port, offset)
+
+    def read_registers(self, port, offset=0, count=PORT_SIZE // REGISTER_SIZE):
+        """
+        Read `count` consecutive registers with one native call.  Returns an
+        `array.array("I")`.
+        """
+        lib, ffi = _native()
+        addr = self._check_span(port, offset, count)
+        out = array.array("I", bytes(count * REGISTER_SIZE))
+        with ffi.from_buffer(self.backing, require_writable=True) as base:
+            lib.chipset_mmio_read32(base + addr, ffi.from_buffer("uint32_t[]", out), count)
+        return out
+
+    def write_registers(self, port, offset, values):
+        """
+        Write consecutive registers from a sequence of 32-bit values with one
+        native call.
+        """
+        values = array.array("I", values)
+        lib, ffi = _native()
+        addr = self._check_span(port, offset, len(values))
+        with ffi.from_buffer(self.backing, require_writable=True) as base:
+            lib.chipset_mmio_write32(base + addr, ffi.from_buffer("uint32_t[]", values),
+                                     len(values))
+
+    def rmw_registers(self, port, offset, masks, values):
+        """
+        For each consecutive register, keep the bits set in the matching entry
+        of `masks` and take the rest from `values`.
+        """
+        masks = array.array("I", masks)
+        values = array.array("I", values)
+        if len(masks) != len(values):
+            raise ValueError("masks and values must have the same length")
+        lib, ffi = _native()
+        addr = self._check_span(port, offset, len(values))
+        with ffi.from_buffer(self.backing, require_writable=True) as base:
+            lib.chipset_mmio_rmw32(base + addr, ffi.from_buffer("uint32_t[]", masks),
+                                   ffi.from_buffer("uint32_t[]", values), len(values))
+
+    def poll_register(self, port, offset, mask, value, max_polls):
+        """
+        Busy-poll a register natively until its value masked with `mask`
+        equals `value`.  Returns `(polls, last_value)`; `polls` is -1 if
+        `max_polls` ran out.
+        """
+        lib, ffi = _native()
+        addr = self._check_span(port, offset, 1)
+        last = ffi.new("uint32_t *")
+        with ffi.from_buffer(self.backing, require_writable=True) as base:
+            polls = lib.chipset_mmio_poll32(base + addr, mask, value, max_polls, last)
+        return polls, last[0]
+
+    def write_batch(self, writes, verify=False):
+        """
+        Write a sequence of `(port, offset, value)` or
+        `(port, offset, value, (always_one, always_zero, no_modify))` entries
+        in the given order.  Every entry is checked before the first store,
+        so a bad one raises ValueError without writing anything.
+
+        Consecutive entries for the same port are written as single 32-bit
+        stores through one memoryview of that port.  The old value is only
+        read for entries with `no_modify` bits.  With `verify`, every register
+        is read back afterwards and compared with the last value written to
+        it; any differences in the bits not covered by that write's masks are
+        reported as `BatchMismatch`es.
+        """
+        entries = [_batch_entry(entry) for entry in writes]
+        written = []
+        for port, group in itertools.groupby(entries, key=lambda w: w[0]):
+            start = self._translate_address(port, 0)
+            with memoryview(self.backing) as view, \
+                 view[start:start + PORT_SIZE].cast("I") as regs:
+                for _, offset, value, masks in group:
+                    idx = offset // REGISTER_SIZE
+                    old = regs[idx] if masks[2] else None
+                    real = augment_value(value, *masks, old)
+                    regs[idx] = real
+                    written.append((port, offset, real, masks))
+        if not verify:
+            return BatchResult(written, None)
+        # Earlier writes to a register were overwritten by the later ones.
+        last = {(w[0], w[1]): idx for idx, w in enumerate(written)}
+        final = [written[idx] for idx in sorted(last.values())]
+        mismatches = []
+        for port, group in itertools.groupby(final, key=lambda w: w[0]):
+            start = self._translate_address(port, 0)
+            with memoryview(self.backing) as view, \
+                 view[start:start + PORT_SIZE].cast("I") as regs:
+                for _, offset, real, masks in group:
+                    relevant = ~(masks[0] | masks[1] | masks[2])
+                    actual = regs[offset // REGISTER_SIZE]
+                    if (actual ^ real) & relevant:
+                        mismatches.append(BatchMismatch(port, offset, real, actual))
+        return BatchResult(written, mismatches)
+
 class Register:
     """
     A convenience representation of a 32-bit register in the PCR.
@@ -80,14 +222,9 @@ class Register:
         return self.pcr.read_register(self.port, self.offset)
 
     def _augment_value(self, val, old=None):
-        val |=  self.always_one
-        val &= ~self.always_zero
-        if self.no_modify != 0:
-            if old is None:
-                old = self.read()
-            val &= ~self.no_modify
-            val |= old & self.no_modify
-        return val
+        if self.no_modify != 0 and old is None:
+            old = self.read()
+        return augment_value(val, self.always_one, self.always_zero, self.no_modify, old)
 
     def get_relevance_mask(self):
         return ~(self.always_one | self.always_zero | self.no_modify)
@@ -96,3 +233,9 @@ class Register:
         real = self._augment_value(value, old=old)
         self.pcr.write_register(self.port, self.offset, real)
         return real
+
+    def wait_for(self, mask, value, timeout, policy=DEFAULT_POLICY):
+        """
+        Wait until `read() & mask == value`; see `chipset.wait.wait_for`.
+        """
+        return wait_for(self.read, mask, value, timeout, policy=policy)
@@ -24,8 +24,6 @@ import sys
 import enum
 import logging
 import argparse
-import progressbar
-progressbar.streams.wrap_stderr()
 from collections import namedtuple
 from .pcr import PCR, Register, PORT_SIZE, REGISTER_SIZE
 
@@ -133,6 +131,7 @@ def map_pcr_port(pcr, port, no_map=None, always_one=None, always_zero=None, no_m
         always_zero = {}
     if no_modify is None:
         no_modify = {}
+    import progressbar
     records = {}
     l.info("Mapping PCR port %x", port)
     for off in progressbar.progressbar(range(0, PORT_SIZE, REGISTER_SIZE)):
@@ -146,6 +145,8 @@ def map_pcr_port(pcr, port, no_map=None, always_one=None, always_zero=None, no_m
     return records
 
 def main():
+    import progressbar
+    progressbar.streams.wrap_stderr()
     logging.basicConfig()
     parser = argparse.ArgumentParser(description=__doc__,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -0,0 +1,3 @@
+from .trace import TraceEvent, TraceRecorder, save_trace, load_trace
+from .simulated import SimulatedMemory, SimulatedPCR, SimulatedDevice
+from .replay import Replayer, count_accesses
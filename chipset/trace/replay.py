@@ -0,0 +1,82 @@
+import time
+from collections import Counter, namedtuple
+from ..memory import Memory
+from ..pcr import PCR
+from ..pcr.pcr import PORT_SHIFT
+
+
+Mismatch = namedtuple("Mismatch", ("index", "event", "observed"))
+ReplayResult = namedtuple("ReplayResult", ("accesses", "mismatches", "elapsed_ns"))
+
+_PCI_READS = {1: "read_byte", 2: "read_word", 4: "read_long"}
+_PCI_WRITES = {1: "write_byte", 2: "write_word", 4: "write_long"}
+
+def count_accesses(events):
+    """
+    Count the accesses in a trace by (target, op).
+    """
+    return Counter((ev.target, ev.op) for ev in events)
+
+class Replayer:
+    """
+    Feeds a recorded trace into (usually simulated) backends.
+
+    `backends` maps each trace target name to a `Memory`, a `PCR` or a
+    `Device`-like object.  Reads are checked against the recorded values
+    and writes are applied in order.  With `realtime` the original spacing
+    between accesses is reproduced; otherwise the trace runs flat out.
+
+    With `seed`, every location whose first access in the trace is a read
+    is preloaded (through the backend's `poke`) with the value that was
+    read from hardware, so only values the traced script itself produced
+    are actually checked.
+    """
+    def __init__(self, backends, realtime=False, seed=True):
+        self.backends = backends
+        self.realtime = realtime
+        self.seed = seed
+
+    def _seed(self, events):
+        touched = set()
+        for ev in events:
+            span = [(ev.target, ev.address + i) for i in range(ev.size)]
+            if ev.op == "read" and not touched.issuperset(span):
+                raw = ev.value.to_bytes(ev.size, "little")
+                for i, key in enumerate(span):
+                    if key not in touched:
+                        self.backends[ev.target].poke(ev.address + i, raw[i:i + 1])
+            touched.update(span)
+
+    def _access(self, ev):
+        backend = self.backends[ev.target]
+        if isinstance(backend, Memory):
+            if ev.op == "read":
+                return backend.read_unsigned(ev.address, ev.size)
+            return backend.write_unsigned(ev.address, ev.value, ev.size)
+        if isinstance(backend, PCR):
+            if ev.size != 4:
+                raise ValueError("PCR accesses must be 4 bytes, not %d" % (ev.size,))
+            port, offset = ev.address >> PORT_SHIFT, ev.address & ((1 << PORT_SHIFT) - 1)
+            if ev.op == "read":
+                return backend.read_register(port, offset)
+            return backend.write_register(port, offset, ev.value)
+        if ev.op == "read":
+            return getattr(backend, _PCI_READS[ev.size])(ev.address)
+        return getattr(backend, _PCI_WRITES[ev.size])(ev.address, ev.value)
+
+    def run(self, events):
+        if self.seed:
+            self._seed(events)
+        mismatches = []
+        start = time.monotonic_ns()
+        origin = events[0].time if events else 0
+        for i, ev in enumerate(events):
+            if self.realtime:
+                delay = (ev.time - origin) - (time.monotonic_ns() - start)
+                if delay > 0:
+                    time.sleep(delay / 1e9)
+            observed = self._access(ev)
+            if ev.op == "read" and observed != ev.value:
+                mismatches.append(Mismatch(i, ev, observed))
+        return ReplayResult(count_accesses(events), mismatches,
+                            time.monotonic_ns() - start)
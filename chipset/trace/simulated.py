@@ -0,0 +1,114 @@
+import mmap
+import struct
+from ..memory import Memory
+from ..pcr import PCR
+from ..pcr.pcr import NUM_PORTS, PORT_SIZE
+
+
+PAGE_SIZE = 4096
+CONFIG_SIZE = 4096
+
+class SimulatedMemory(Memory):
+    """
+    A `Memory` backed by sparse, zero-filled pages instead of /dev/mem.
+    """
+    def __init__(self):
+        self.fd = None
+        self.pages = {}
+
+    def close(self):
+        self.pages.clear()
+
+    def _page(self, number):
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = bytearray(PAGE_SIZE)
+        return page
+
+    def read(self, address, length):
+        out = bytearray()
+        while length > 0:
+            number, off = divmod(address, PAGE_SIZE)
+            chunk = min(length, PAGE_SIZE - off)
+            page = self.pages.get(number)
+            out += page[off:off + chunk] if page is not None else bytes(chunk)
+            address += chunk
+            length -= chunk
+        return bytes(out)
+
+    def write(self, address, content):
+        content = memoryview(content)
+        while content:
+            number, off = divmod(address, PAGE_SIZE)
+            chunk = min(len(content), PAGE_SIZE - off)
+            self._page(number)[off:off + chunk] = content[:chunk]
+            address += chunk
+            content = content[chunk:]
+
+    peek = read
+    poke = write
+
+class SimulatedPCR(PCR):
+    """
+    A `PCR` backed by an anonymous mapping instead of /dev/mem.
+    """
+    def __init__(self, base=0):
+        self.base = base
+        self.fd = None
+        self.backing = mmap.mmap(-1, NUM_PORTS * PORT_SIZE)
+
+    def close(self):
+        self.backing.close()
+
+    def peek(self, address, length):
+        return self.backing[address:address + length]
+
+    def poke(self, address, data):
+        self.backing[address:address + len(data)] = data
+
+class SimulatedDevice:
+    """
+    A stand-in for a PCI `Device` whose configuration space is a bytearray.
+    """
+    def __init__(self, domain=0, bus=0, dev=0, func=0, config=None):
+        self.domain = domain
+        self.bus = bus
+        self.dev = dev
+        self.func = func
+        self.config = bytearray(CONFIG_SIZE)
+        if config is not None:
+            self.config[:len(config)] = config
+
+    def read_byte(self, pos):
+        return self.config[pos]
+
+    def read_word(self, pos):
+        return struct.unpack_from("<H", self.config, pos)[0]
+
+    def read_long(self, pos):
+        return struct.unpack_from("<I", self.config, pos)[0]
+
+    def read_block(self, pos, length):
+        return bytes(self.config[pos:pos + length])
+
+    def write_byte(self, pos, byte):
+        self.config[pos] = byte
+        return True
+
+    def write_word(self, pos, word):
+        struct.pack_into("<H", self.config, pos, word)
+        return True
+
+    def write_long(self, pos, long):
+        struct.pack_into("<I", self.config, pos, long)
+        return True
+
+    def write_block(self, pos, data):
+        self.config[pos:pos + len(data)] = data
+        return True
+
+    def peek(self, address, length):
+        return self.read_block(address, length)
+
+    def poke(self, address, data):
+        self.write_block(address, data)
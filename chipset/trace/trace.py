@@ -0,0 +1,93 @@
+import json
+import time
+from collections import namedtuple
+
+
+TraceEvent = namedtuple("TraceEvent", ("time", "target", "op", "address", "size", "value"))
+
+# For each kind of backend, the methods that touch hardware and how to pull
+# (address, size, value) out of their arguments.  `value` is None for reads;
+# the recorder fills it in from the return value.
+_HOOKS = {
+    "mem": {
+        "read_unsigned": ("read", lambda address, size: (address, size, None)),
+        "read_qword": ("read", lambda address: (address, 8, None)),
+        "read_dword": ("read", lambda address: (address, 4, None)),
+        "read_word": ("read", lambda address: (address, 2, None)),
+        "read_byte": ("read", lambda address: (address, 1, None)),
+        "write_unsigned": ("write", lambda address, value, size: (address, size, value)),
+        "write_qword": ("write", lambda address, value: (address, 8, value)),
+        "write_dword": ("write", lambda address, value: (address, 4, value)),
+        "write_word": ("write", lambda address, value: (address, 2, value)),
+        "write_byte": ("write", lambda address, value: (address, 1, value)),
+    },
+    "pcr": {
+        "read_register": ("read", lambda port, offset: ((port << 16) + offset, 4, None)),
+        "write_register": ("write", lambda port, offset, value: ((port << 16) + offset, 4, value)),
+    },
+    "pci": {
+        "read_byte": ("read", lambda pos: (pos, 1, None)),
+        "read_word": ("read", lambda pos: (pos, 2, None)),
+        "read_long": ("read", lambda pos: (pos, 4, None)),
+        "write_byte": ("write", lambda pos, byte: (pos, 1, byte)),
+        "write_word": ("write", lambda pos, word: (pos, 2, word)),
+        "write_long": ("write", lambda pos, long: (pos, 4, long)),
+    },
+}
+
+class _RecordingProxy:
+    def __init__(self, recorder, backend, target, kind):
+        self._recorder = recorder
+        self._backend = backend
+        self._target = target
+        self._hooks = _HOOKS[kind]
+
+    def __getattr__(self, name):
+        attr = getattr(self._backend, name)
+        if name not in self._hooks:
+            return attr
+        op, decode = self._hooks[name]
+        def hooked(*args):
+            address, size, value = decode(*args)
+            res = attr(*args)
+            if op == "read":
+                value = res
+            self._recorder.record(self._target, op, address, size, value)
+            return res
+        return hooked
+
+    def __enter__(self):
+        self._backend.__enter__()
+        return self
+
+    def __exit__(self, ex_t, ex_v, ex_tb):
+        return self._backend.__exit__(ex_t, ex_v, ex_tb)
+
+class TraceRecorder:
+    """
+    Records the register accesses made through wrapped backends.
+
+    `kind` is one of "mem" (a `Memory`), "pcr" (a `PCR`; addresses are
+    recorded as (port << 16) + offset) or "pci" (a `Device`).  `target` is
+    the name the access is recorded under, and the name the replayer will
+    look the backend up by.
+    """
+    def __init__(self):
+        self.events = []
+        self.start = time.monotonic_ns()
+
+    def wrap(self, backend, target, kind):
+        if kind not in _HOOKS:
+            raise ValueError("unknown backend kind %r" % (kind,))
+        return _RecordingProxy(self, backend, target, kind)
+
+    def record(self, target, op, address, size, value):
+        self.events.append(TraceEvent(time.monotonic_ns() - self.start,
+                                      target, op, address, size, value))
+
+def save_trace(events, f):
+    for ev in events:
+        f.write(json.dumps(ev._asdict()) + "\n")
+
+def load_trace(f):
+    return [TraceEvent(**json.loads(line)) for line in f if line.strip()]
@@ -0,0 +1,44 @@
+import os
+import time
+from collections import namedtuple
+
+
+WaitPolicy = namedtuple("WaitPolicy", ("spins", "yields", "min_sleep_ns", "max_sleep_ns"))
+WaitResult = namedtuple("WaitResult", ("satisfied", "value", "elapsed_ns", "polls",
+                                       "spins", "yields", "sleeps"))
+
+DEFAULT_POLICY = WaitPolicy(spins=64, yields=64, min_sleep_ns=10000, max_sleep_ns=1000000)
+
+def wait_for(read, mask, value, timeout, policy=DEFAULT_POLICY):
+    """
+    Poll `read()` until `read() & mask == value` or `timeout` seconds pass.
+
+    Polling first spins for `policy.spins` reads, then yields the CPU between
+    the next `policy.yields` reads, and then sleeps between reads, doubling
+    the sleep from `policy.min_sleep_ns` up to `policy.max_sleep_ns`.  Sleeps
+    never overshoot the deadline.
+
+    Returns a `WaitResult`; `satisfied` is False if the timeout expired, in
+    which case `value` is the last value read.
+    """
+    start = time.perf_counter_ns()
+    deadline = start + int(timeout * 1e9)
+    polls = spins = yields = sleeps = 0
+    sleep_ns = policy.min_sleep_ns
+    while True:
+        current = read()
+        polls += 1
+        now = time.perf_counter_ns()
+        if current & mask == value:
+            return WaitResult(True, current, now - start, polls, spins, yields, sleeps)
+        if now >= deadline:
+            return WaitResult(False, current, now - start, polls, spins, yields, sleeps)
+        if spins < policy.spins:
+            spins += 1
+        elif yields < policy.yields:
+            yields += 1
+            os.sched_yield()
+        else:
+            sleeps += 1
+            time.sleep(min(sleep_ns, deadline - now) / 1e9)
+            sleep_ns = min(sleep_ns * 2, policy.max_sleep_ns)
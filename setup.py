@@ -6,14 +6,15 @@ setup(
     version="0.1",
     packages=["chipset"],
     install_requires=["progressbar2",
-                      "cffi>=1.0.0"],
-    setup_requires=["cffi>=1.0.0"],
+                      "cffi>=1.12"],
+    setup_requires=["cffi>=1.12"],
     cffi_modules=["chipset/pci/libpci_build.py:builder"],
     entry_points={
         "console_scripts": [
             "pcrportmap = chipset.pcr.port_mapper:main",
             "memtool = chipset.memory.memory:main",
-            "pcitool = chipset.pci.pci:main"
+            "pcitool = chipset.pci.tool:main",
+            "chipexporter = chipset.exporter.exporter:main"
         ]
     }
 )
@@ -0,0 +1,55 @@
+"""
+Dumping, archiving and reloading configuration spaces.
+"""
+import io
+import struct
+import pytest
+from chipset.pci.archive import (ArchiveAccess, DumpRecord, dump_devices, write_archive,
+                                 read_archive, load_archive)
+
+
+def _config(vendor_id, device_id, size=256):
+    config = bytearray(size)
+    struct.pack_into("<HH", config, 0, vendor_id, device_id)
+    struct.pack_into("<H", config, 0x0a, 0x0200)
+    return bytes(config)
+
+@pytest.fixture
+def records():
+    return [DumpRecord(0, 0, 0x1f, 0, _config(0x8086, 0xa1c8)),
+            DumpRecord(0, 0x3b, 0, 1, _config(0x15b3, 0x1017, 4096)),
+            DumpRecord(1, 2, 3, 4, _config(0x10de, 0x1eb8))]
+
+@pytest.mark.parametrize("fmt", ["binary", "jsonl"])
+def test_round_trip(records, fmt, tmp_path):
+    f = io.BytesIO() if fmt == "binary" else io.StringIO()
+    write_archive(f, records, fmt=fmt)
+    data = f.getvalue()
+    if fmt == "jsonl":
+        data = data.encode()
+    assert read_archive(data) == records
+    path = tmp_path / "dump"
+    path.write_bytes(data)
+    assert load_archive(str(path)).records == records
+
+def test_bad_format(records):
+    with pytest.raises(ValueError):
+        write_archive(io.BytesIO(), records, fmt="xml")
+
+def test_archive_access(records):
+    access = ArchiveAccess(records)
+    assert access.idents() == {(0, 0, 0x1f, 0): (0x8086, 0xa1c8),
+                               (0, 0x3b, 0, 1): (0x15b3, 0x1017),
+                               (1, 2, 3, 4): (0x10de, 0x1eb8)}
+    dev = access.get_device(0, 0x3b, 0, 1)
+    assert dev.device_class == 0x0200
+    assert dev.read_long(0xffc) == 0
+    assert access.get_device(0, 0, 0x1f, 0).read_long(0xffc) == 0xffffffff
+    with pytest.raises(ValueError):
+        dev.write_long(0x40, 0)
+    assert access.first_device.next is dev
+
+def test_dump_reloaded_archive(records):
+    # An archive can itself be dumped; devices keep their own sizes.
+    for workers in (1, 4):
+        assert dump_devices(ArchiveAccess(records), workers=workers) == records
@@ -0,0 +1,90 @@
+"""
+Offline decoding of configuration space images and lspci dumps.
+"""
+import struct
+from chipset.pci.decode import (decode, decode_body, parse_lspci_dump, NormalHeader,
+                                BridgeHeader, CardbusHeader, MSICapability,
+                                PCIeCapability, AERCapability, SRIOVCapability,
+                                HEADER_LAYOUTS, ERR_LAYOUT)
+from chipset.pci.regs import (PCI_HEADER_TYPE_NORMAL, PCI_HEADER_TYPE_BRIDGE,
+                              PCI_HEADER_TYPE_CARDBUS, PCI_CAP_NORMAL, PCI_CAP_EXTENDED)
+
+
+def _image(size=4096, header_type=0):
+    config = bytearray(size)
+    struct.pack_into("<HHHH", config, 0, 0x8086, 0x1234, 0x0406, 0x0010)
+    config[0x0e] = header_type
+    return config
+
+def test_layout_sizes():
+    # Each layout ends where the next part of configuration space starts.
+    assert 0x10 + HEADER_LAYOUTS[PCI_HEADER_TYPE_NORMAL].size == 0x40
+    assert 0x10 + HEADER_LAYOUTS[PCI_HEADER_TYPE_BRIDGE].size == 0x40
+    assert 0x10 + HEADER_LAYOUTS[PCI_HEADER_TYPE_CARDBUS].size == 0x48
+    assert ERR_LAYOUT.size == 0x38
+
+def test_normal_header():
+    config = _image()
+    struct.pack_into("<6I", config, 0x10, *range(1, 7))
+    struct.pack_into("<HH", config, 0x2c, 0x1028, 0x0abc)
+    config[0x3c:0x3e] = b"\x0b\x01"
+    res = decode(config[:64])
+    assert res.header.vendor_id == 0x8086
+    assert isinstance(res.body, NormalHeader)
+    assert res.body.base_address == (1, 2, 3, 4, 5, 6)
+    assert (res.body.subsystem_vendor_id, res.body.subsystem_id) == (0x1028, 0x0abc)
+    assert (res.body.interrupt_line, res.body.interrupt_pin) == (0x0b, 1)
+
+def test_bridge_header():
+    config = _image(header_type=PCI_HEADER_TYPE_BRIDGE)
+    config[0x18:0x1b] = b"\x00\x01\x05"
+    body = decode(config).body
+    assert isinstance(body, BridgeHeader)
+    assert (body.primary_bus, body.secondary_bus, body.subordinate_bus) == (0, 1, 5)
+
+def test_short_cardbus_header():
+    config = _image(header_type=PCI_HEADER_TYPE_CARDBUS)
+    assert decode(config[:64]).body is None
+    assert decode_body(config[:64], PCI_HEADER_TYPE_CARDBUS) is None
+    assert isinstance(decode(config[:128]).body, CardbusHeader)
+
+def test_capabilities():
+    config = _image()
+    config[0x34] = 0x50
+    # MSI, 64-bit, at 0x50 -> PCIe at 0x70.
+    struct.pack_into("<BBHQH", config, 0x50, 0x05, 0x70, 0x0081, 0xfee00000, 0x4021)
+    struct.pack_into("<BBH", config, 0x70, 0x10, 0x00, 0x0042)
+    # AER at 0x100 -> SR-IOV at 0x140.
+    struct.pack_into("<I6I", config, 0x100, 0x00010001 | (0x140 << 20), 0x20, 0, 0, 0x41, 0, 0)
+    struct.pack_into("<IIHHHHH", config, 0x140, 0x00010010, 0, 0, 0, 8, 64, 3)
+    caps = decode(config).capabilities
+    assert [(c.id, c.type, c.offset) for c in caps] == [
+        (0x05, PCI_CAP_NORMAL, 0x50), (0x10, PCI_CAP_NORMAL, 0x70),
+        (0x01, PCI_CAP_EXTENDED, 0x100), (0x10, PCI_CAP_EXTENDED, 0x140)]
+    msi, exp, aer, sriov = (c.record for c in caps)
+    assert isinstance(msi, MSICapability)
+    assert (msi.is_64bit, msi.address, msi.data, msi.enabled) == (True, 0xfee00000, 0x4021, True)
+    assert isinstance(exp, PCIeCapability) and exp.port_type == 4
+    assert isinstance(aer, AERCapability)
+    assert (aer.uncor_status, aer.cor_status) == (0x20, 0x41)
+    assert isinstance(sriov, SRIOVCapability)
+    assert (sriov.total_vfs, sriov.num_vfs) == (64, 3)
+
+def test_truncated_capability():
+    config = _image(256)
+    config[0x34] = 0xf8
+    struct.pack_into("<BB", config, 0xf8, 0x10, 0x00)
+    caps = decode(config).capabilities
+    assert [(c.id, c.offset, c.record) for c in caps] == [(0x10, 0xf8, None)]
+
+def test_parse_lspci_dump():
+    text = ("0001:3b:00.1 Ethernet controller: Mellanox\n"
+            "00: b3 15 17 10 06 04 10 00 00 00 00 02 00 00 00 00\n"
+            "10: 0c 00 00 e0 00 00 00 00 00 00 00 00 00 00 00 00\n"
+            "\n"
+            "00:1f.0 ISA bridge: Intel\n"
+            "00: 86 80 c8 a1 07 00 10 02 10 00 01 06 00 00 80 00\n")
+    dumps = parse_lspci_dump(text)
+    assert sorted(dumps) == [(0, 0, 0x1f, 0), (1, 0x3b, 0, 1)]
+    assert len(dumps[(1, 0x3b, 0, 1)]) == 32
+    assert dumps[(0, 0, 0x1f, 0)][:4] == b"\x86\x80\xc8\xa1"
@@ -0,0 +1,148 @@
+"""
+ECAM access against a small file laid out like memory-mapped configuration
+space.
+"""
+import struct
+import pytest
+from chipset.pci.ecam import ECAM, BUS_WINDOW_SIZE, MCFG_HEADER_SIZE
+from chipset.pci.watch import DeviceWatcher, ADDED, CHANGED
+
+
+def _offset(bus, dev, func):
+    return (bus << 20) | (dev << 15) | (func << 12)
+
+def _put(f, offset, vendor_id, device_id, header_type=0, device_class=0):
+    f.seek(offset)
+    f.write(struct.pack("<HH", vendor_id, device_id))
+    f.seek(offset + 0x0a)
+    f.write(struct.pack("<HxxB", device_class, header_type))
+
+@pytest.fixture
+def image(tmp_path):
+    """
+    Two buses: a bridge at 00:01.0 leading to bus 1, a multi-function
+    device at 01:00.0/01:00.2 behind it, and a plain device at 00:00.0.
+    """
+    path = tmp_path / "ecam.img"
+    with open(path, "wb") as f:
+        f.truncate(2 * BUS_WINDOW_SIZE)
+        _put(f, _offset(0, 0, 0), 0x8086, 0x1234, device_class=0x0600)
+        _put(f, _offset(0, 1, 0), 0x8086, 0x1235, header_type=1, device_class=0x0604)
+        f.seek(_offset(0, 1, 0) + 0x18)
+        f.write(bytes([0, 1, 1]))
+        _put(f, _offset(1, 0, 0), 0x15b3, 0x1017, header_type=0x80, device_class=0x0200)
+        _put(f, _offset(1, 0, 2), 0x15b3, 0x1018, device_class=0x0200)
+    return path
+
+@pytest.fixture
+def ecam(image):
+    access = ECAM(base=0, segment=0, end_bus=1, path=str(image))
+    yield access
+    access.close()
+
+def test_enumeration(ecam):
+    assert ecam.idents() == {
+        (0, 0, 0, 0): (0x8086, 0x1234),
+        (0, 0, 1, 0): (0x8086, 0x1235),
+        (0, 1, 0, 0): (0x15b3, 0x1017),
+        (0, 1, 0, 2): (0x15b3, 0x1018),
+    }
+    assert [dev.func for dev in ecam.find_devices(0x15b3, 0x1018)] == [2]
+    assert len(ecam.find_devices_by_class(0x0200)) == 2
+    assert ecam.get_device(1, 0, 0, 0) is None
+
+def test_reads(ecam):
+    dev = ecam.get_device(0, 1, 0, 0)
+    assert dev.read_word(0) == 0x15b3
+    assert dev.read_long(0) == 0x101715b3
+    assert dev.read_byte(0x0e) == 0x80
+    assert dev.read_block(0, 4) == b"\xb3\x15\x17\x10"
+    buf = bytearray(6)
+    assert dev.read_block_into(1, buf) == 6
+    assert bytes(buf) == b"\x15\x17\x10\x00\x00\x00"
+
+def test_writes(ecam, image):
+    dev = ecam.get_device(0, 1, 0, 0)
+    assert dev.write_long(0x40, 0xdeadbeef)
+    assert dev.write_word(0x44, 0x1234)
+    assert dev.write_byte(0x47, 0x56)
+    assert dev.write_block(0x49, b"\x01\x02\x03")
+    with open(image, "rb") as f:
+        f.seek(_offset(1, 0, 0) + 0x40)
+        assert f.read(12) == b"\xef\xbe\xad\xde\x34\x12\x00\x56\x00\x01\x02\x03"
+    assert dev.read_long(0x40) == 0xdeadbeef
+
+def test_buffered_writes(ecam):
+    dev = ecam.get_device(0, 0, 0, 0)
+    dev.load_config(4096)
+    dev.write_word(0x42, 0xabcd)
+    assert ecam.get_device(0, 0, 0, 0).read_word(0x42) == 0
+    dev.flush()
+    assert ecam.get_device(0, 0, 0, 0).read_word(0x42) == 0xabcd
+
+def test_rescan(ecam, image):
+    with open(image, "r+b") as f:
+        _put(f, _offset(1, 0, 2), 0x15b3, 0x101b)
+        _put(f, _offset(1, 3, 0), 0x10de, 0x1eb8)
+    ecam.rescan_bus(buses=[1], domain=0)
+    assert ecam.idents()[(0, 1, 0, 2)] == (0x15b3, 0x101b)
+    assert (0, 1, 3, 0) in ecam.idents()
+    assert len(ecam) == 5
+
+def test_topology(ecam):
+    topology = ecam.topology
+    bridge = ecam.search_for_device(0, 1, 0, 0)
+    assert topology.bus_range(bridge) == (1, 1)
+    # A fresh wrapper for an indexed device must be accepted.
+    dev = ecam.get_device(0, 1, 0, 2)
+    assert topology.parent(dev) is bridge
+    assert topology.path(dev)[0] is bridge
+    assert [(d.bus, d.func) for d in topology.subtree(bridge)] == [(1, 0), (1, 2)]
+
+def test_watcher(ecam, image):
+    watcher = DeviceWatcher(ecam, stamp_path=None)
+    events = []
+    watcher.subscribe(events.append)
+    assert watcher.poll() == []
+    with open(image, "r+b") as f:
+        _put(f, _offset(0, 2, 0), 0x1af4, 0x1000)
+        _put(f, _offset(0, 0, 0), 0x8086, 0x4321)
+    watcher.poll()
+    assert [(e.kind, e.address) for e in events] == [
+        (CHANGED, (0, 0, 0, 0)), (ADDED, (0, 0, 2, 0))]
+
+def test_mcfg_regions(image, tmp_path):
+    """
+    One segment split over two MCFG entries; bases are bus 0's address.
+    """
+    mcfg = tmp_path / "MCFG"
+    entry = struct.Struct("<QHBB4x")
+    mcfg.write_bytes(bytes(MCFG_HEADER_SIZE) + entry.pack(0, 0, 0, 0) + entry.pack(0, 0, 1, 1))
+    access = ECAM(segment=0, path=str(image), mcfg_path=str(mcfg))
+    try:
+        assert len(access) == 4
+        assert access.segment_stats()[0].buses == 2
+    finally:
+        access.close()
+    mcfg.write_bytes(bytes(MCFG_HEADER_SIZE) + entry.pack(0, 0, 0, 1) + entry.pack(0, 0, 1, 1))
+    with pytest.raises(ValueError):
+        ECAM(segment=0, path=str(image), mcfg_path=str(mcfg))
+
+def test_out_of_range(ecam):
+    dev = ecam.get_device(0, 0, 0, 0)
+    assert dev.read_block(0xffe, 4) is None
+    assert dev.read_block_into(0x1000, bytearray(1)) is None
+    assert dev.read_long(0xffe) == 0xffffffff
+    assert dev.read_byte(-1) == 0xff
+    assert not dev.write_long(0xffe, 0)
+    assert not dev.write_block(0xfff, b"\0\0")
+
+def test_device_list(ecam):
+    dev = ecam.first_device
+    walked = []
+    while dev is not None:
+        walked.append((dev.bus, dev.dev, dev.func))
+        dev = dev.next
+    assert walked == [(0, 0, 0), (0, 1, 0), (1, 0, 0), (1, 0, 2)]
+    assert ecam.get_device(0, 1, 0, 2).next is None
+    assert ecam.first_device.find_capability(0x10, 1) is None
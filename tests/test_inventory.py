@@ -0,0 +1,68 @@
+"""
+Inventory collection, storage and diffs, over archived devices.
+"""
+import io
+import gzip
+import json
+import struct
+import pytest
+from chipset.pci.archive import ArchiveAccess, DumpRecord
+from chipset.pci.events import ADDED, REMOVED, CHANGED
+from chipset.pci.inventory import (Change, collect_inventory, write_inventory,
+                                   read_inventory, diff, diff_against)
+
+
+def _record(bus, vendor_id, device_id, bar0=0xfe000000):
+    config = bytearray(256)
+    struct.pack_into("<HH", config, 0, vendor_id, device_id)
+    struct.pack_into("<H", config, 0x0a, 0x0200)
+    struct.pack_into("<I", config, 0x10, bar0)
+    return DumpRecord(0, bus, 0, 0, bytes(config))
+
+def _inventory(records, host="golden", **kwargs):
+    return collect_inventory(ArchiveAccess(records), host=host, **kwargs)
+
+@pytest.fixture
+def records():
+    return [_record(1, 0x8086, 0x1234), _record(2, 0x15b3, 0x1017), _record(3, 0x10de, 0x1eb8)]
+
+def test_collect(records):
+    inventory = _inventory(records, config_hashes=True)
+    columns = inventory.columns
+    assert columns["address"] == ["0000:01:00.0", "0000:02:00.0", "0000:03:00.0"]
+    assert columns["vendor_id"] == [0x8086, 0x15b3, 0x10de]
+    assert columns["bars"][0] == [0xfe000000, 0, 0, 0, 0, 0]
+    assert columns["sizes"] == [None] * 3
+    assert all(len(h) == 40 for h in columns["config_hash"])
+    assert _inventory(records).columns["config_hash"] == [None] * 3
+
+def test_round_trip(records):
+    inventory = _inventory(records)
+    f = io.BytesIO()
+    write_inventory(f, inventory)
+    assert read_inventory(f.getvalue()) == inventory
+
+def test_bad_documents():
+    with pytest.raises(ValueError):
+        read_inventory(gzip.compress(b'{"format": "something-else"}'))
+    doc = {"format": "chipset-pci-inventory", "version": 1, "host": "h",
+           "digest": "", "columns": {"address": []}}
+    with pytest.raises(ValueError):
+        read_inventory(gzip.compress(json.dumps(doc).encode()))
+
+def test_diff(records):
+    golden = _inventory(records)
+    assert diff(golden, _inventory(list(reversed(records)), host="other")) == []
+    changed = [_record(1, 0x8086, 0x1234, bar0=0xfd000000), records[2],
+               _record(4, 0x1af4, 0x1000)]
+    assert diff(golden, _inventory(changed)) == [
+        Change(CHANGED, "0000:01:00.0", ("bars",)),
+        Change(REMOVED, "0000:02:00.0", ()),
+        Change(ADDED, "0000:04:00.0", ())]
+
+def test_diff_against(records):
+    golden = _inventory(records)
+    same = _inventory(records, host="same")
+    other = _inventory(records[:2], host="other")
+    assert diff_against(golden, [same, other]) == {
+        "other": [Change(REMOVED, "0000:03:00.0", ())]}
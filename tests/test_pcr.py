@@ -0,0 +1,42 @@
+"""
+PCR.write_batch against a SimulatedPCR.
+"""
+import pytest
+from chipset.trace import SimulatedPCR
+
+
+@pytest.fixture
+def pcr():
+    pcr = SimulatedPCR()
+    yield pcr
+    pcr.close()
+
+def test_write_batch(pcr):
+    pcr.write_register(0xc4, 8, 0xff00ff00)
+    res = pcr.write_batch([(0xc4, 0, 0x1234),
+                           (0xc4, 8, 0x10, (0x100, 0x1, 0xff000000)),
+                           (0xc6, 4, 0xffffffff)], verify=True)
+    assert res.mismatches == []
+    assert pcr.read_register(0xc4, 0) == 0x1234
+    assert pcr.read_register(0xc4, 8) == 0xff000110
+    assert pcr.read_register(0xc6, 4) == 0xffffffff
+    assert pcr.write_batch([(0xc4, 0, 1)]).mismatches is None
+
+def test_verify_checks_last_write(pcr):
+    res = pcr.write_batch([(0xc4, 0, 1), (0xc4, 4, 5), (0xc4, 0, 2)], verify=True)
+    assert res.mismatches == []
+    assert pcr.read_register(0xc4, 0) == 2
+
+@pytest.mark.parametrize("bad", [
+    (0xc4, 2, 1),
+    (0xc4, 0x10000, 1),
+    (256, 0, 1),
+    (-1, 0, 1),
+    (0xc4, 0, 1, (0, 0)),
+    (0xc4, 0),
+])
+def test_bad_entry_writes_nothing(pcr, bad):
+    with pytest.raises(ValueError):
+        pcr.write_batch([(0xc4, 0, 0x1234), (0xc4, 4, 0x5678), bad])
+    assert pcr.read_register(0xc4, 0) == 0
+    assert pcr.read_register(0xc4, 4) == 0
@@ -0,0 +1,153 @@
+"""
+SysfsPCI and DeviceWatcher against a temporary directory laid out like
+/sys/bus/pci/devices.
+"""
+import os
+import struct
+import shutil
+import resource
+import pytest
+from chipset.pci.regs import PCI_CAP_EXTENDED, PCI_CAP_ID_MSI, PCI_CAP_ID_PM, PCI_CAP_NORMAL
+from chipset.pci.sysfs import SysfsPCI
+from chipset.pci.watch import DeviceWatcher, ADDED, REMOVED, CHANGED
+
+
+def _add(root, name, vendor_id, device_id, device_class=0x020000, header_type=0):
+    path = root / name
+    path.mkdir()
+    config = bytearray(256)
+    struct.pack_into("<HH", config, 0, vendor_id, device_id)
+    struct.pack_into("<HxxB", config, 0x0a, device_class >> 8, header_type)
+    (path / "config").write_bytes(config)
+    (path / "vendor").write_text("0x%04x\n" % (vendor_id,))
+    (path / "device").write_text("0x%04x\n" % (device_id,))
+    (path / "class").write_text("0x%06x\n" % (device_class,))
+    (path / "resource").write_text("0x00000000fe000000 0x00000000fe0fffff 0x0000000000040200\n"
+                                   + "0x0000000000000000 0x0000000000000000 0x0000000000000000\n" * 6)
+    return path
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "devices"
+    root.mkdir()
+    _add(root, "0000:00:1f.0", 0x8086, 0xa1c8, device_class=0x060100)
+    _add(root, "0001:3b:00.1", 0x15b3, 0x1017)
+    # Anything that isn't a device address is ignored.
+    (root / "junk").mkdir()
+    return root
+
+@pytest.fixture
+def sysfs(root):
+    access = SysfsPCI(str(root))
+    yield access
+    access.close()
+
+def test_enumeration(sysfs):
+    assert sysfs.idents() == {(0, 0, 0x1f, 0): (0x8086, 0xa1c8),
+                              (1, 0x3b, 0, 1): (0x15b3, 0x1017)}
+    assert sysfs.domains() == [0, 1]
+    dev = sysfs.search_for_device(0x3b, 0, 1, 1)
+    assert (dev.vendor_id, dev.device_id, dev.device_class) == (0x15b3, 0x1017, 0x0200)
+    assert dev.base_addr[0] == 0xfe000000
+    assert dev.sizes[0] == 0x100000
+    assert sysfs.get_device(2, 0, 0, 0) is None
+
+def test_reads_and_writes(sysfs, root):
+    dev = sysfs.get_device(0, 0, 0x1f, 0)
+    assert dev.read_long(0) == 0xa1c88086
+    assert dev.read_block(0x0a, 2) == b"\x01\x06"
+    assert dev.write_long(0x40, 0x12345678)
+    assert dev.write_byte(0x44, 0x9a)
+    config = (root / "0000:00:1f.0" / "config").read_bytes()
+    assert config[0x40:0x45] == b"\x78\x56\x34\x12\x9a"
+    assert dev.read_word(0x42) == 0x1234
+
+def test_rescan(sysfs, root):
+    _add(root, "0000:00:02.0", 0x8086, 0x3e92, device_class=0x030000)
+    shutil.rmtree(root / "0001:3b:00.1")
+    sysfs.rescan_bus(buses=[0], domain=0)
+    assert sorted(sysfs.idents()) == [(0, 0, 2, 0), (0, 0, 0x1f, 0), (1, 0x3b, 0, 1)]
+    sysfs.rescan_bus()
+    assert sorted(sysfs.idents()) == [(0, 0, 2, 0), (0, 0, 0x1f, 0)]
+
+def test_watcher_stamps_access_root(sysfs, root):
+    watcher = DeviceWatcher(sysfs, full_every=0)
+    assert watcher.stamp_path == str(root)
+    assert watcher.poll() == []
+    _add(root, "0000:00:02.0", 0x8086, 0x3e92)
+    # Make sure the directory mtime moves even on coarse clocks.
+    os.utime(root, ns=(0, 1))
+    events = watcher.poll()
+    assert [(e.kind, e.address, e.new) for e in events] == [(ADDED, (0, 0, 2, 0), (0x8086, 0x3e92))]
+
+def test_watcher_events(sysfs, root):
+    watcher = DeviceWatcher(sysfs, stamp_path=None)
+    seen = []
+    watcher.subscribe(seen.append)
+    config = root / "0000:00:1f.0" / "config"
+    data = bytearray(config.read_bytes())
+    struct.pack_into("<H", data, 2, 0xa1c9)
+    config.write_bytes(data)
+    shutil.rmtree(root / "0001:3b:00.1")
+    watcher.poll()
+    assert [(e.kind, e.address) for e in seen] == [(CHANGED, (0, 0, 0x1f, 0)),
+                                                   (REMOVED, (1, 0x3b, 0, 1))]
+    assert seen[0].old == (0x8086, 0xa1c8)
+
+def test_device_list(sysfs):
+    dev = sysfs.devices
+    assert dev is sysfs.first_device
+    walked = []
+    while dev is not None:
+        walked.append(dev)
+        dev = dev.next
+    assert walked == list(sysfs)
+
+def test_device_interface(sysfs, root):
+    path = root / "0001:3b:00.1"
+    config = bytearray((path / "config").read_bytes())
+    config[0x06] |= 0x10
+    config[0x34] = 0x40
+    config[0x40:0x42] = bytes([PCI_CAP_ID_PM, 0x50])
+    config[0x50:0x52] = bytes([PCI_CAP_ID_MSI, 0])
+    (path / "config").write_bytes(config)
+    (path / "modalias").write_text("pci:v000015B3d00001017\n")
+    dev = sysfs.get_device(1, 0x3b, 0, 1)
+    assert dev.module_alias == b"pci:v000015B3d00001017"
+    assert dev.label is None
+    cap = dev.find_capability(PCI_CAP_ID_MSI, PCI_CAP_NORMAL)
+    assert (cap.id, cap.type, cap.addr, cap.next) == (PCI_CAP_ID_MSI, PCI_CAP_NORMAL, 0x50, None)
+    assert dev.first_cap.next.addr == 0x50
+    assert dev.find_capability(PCI_CAP_ID_MSI, PCI_CAP_EXTENDED) is None
+    config[0x06] &= ~0x10
+    (path / "config").write_bytes(config)
+    assert dev.first_cap is not None
+    dev.clear_cache()
+    assert dev.first_cap is None
+    info = dev.snapshot()
+    assert (info.domain, info.bus, info.vendor_id, info.device_class) == (1, 0x3b, 0x15b3, 0x0200)
+    assert info.sizes[0] == 0x100000 and info.module_alias == b"pci:v000015B3d00001017"
+    assert [i.device_id for i in sysfs.snapshot_all()] == [0xa1c8, 0x1017]
+
+def test_empty_device_list(tmp_path):
+    assert SysfsPCI(str(tmp_path)).first_device is None
+
+def test_open_fds_are_bounded(tmp_path):
+    root = tmp_path / "many"
+    root.mkdir()
+    for func in range(300):
+        _add(root, "0000:%02x:%02x.%d" % (func >> 8, (func >> 3) & 0x1f, func & 7),
+             0x15b3, 0x1000 + func)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    in_use = len(os.listdir("/proc/self/fd"))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (in_use + 64, hard))
+    try:
+        access = SysfsPCI(str(root), max_open=16)
+        try:
+            assert len(access) == 300
+            assert [dev.read_word(2) for dev in access] == [0x1000 + n for n in range(300)]
+            assert len(access._open) == 16
+        finally:
+            access.close()
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))